@@ -0,0 +1,108 @@
+# server/app/cache.py
+import hashlib
+import threading
+import time
+from typing import Any, Hashable
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Small in-process cache for hot read endpoints.
+
+    Entries expire after `ttl` seconds (None = kept until cleared); writers call
+    clear() after commit so readers never wait out the TTL for their own change.
+    Every clear() bumps `generation`: a reader notes it before querying and
+    passes it to set(), which drops the value if a clear() happened meanwhile
+    (the snapshot may predate that write). The app runs a single uvicorn
+    process, so one dict per cache is enough.
+    """
+
+    def __init__(self, ttl: float | None = None, maxsize: int = 128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: dict[Hashable, tuple[float, Any]] = {}
+        self.generation = 0
+        self._lock = threading.Lock()  # sync readers run in the threadpool
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        hit = self._data.get(key, _MISSING)
+        if hit is _MISSING:
+            return default
+        expires, value = hit
+        if self.ttl is not None and time.monotonic() >= expires:
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return  # cleared since the reader started: the value may be stale
+            if key not in self._data and len(self._data) >= self.maxsize:
+                # drop the oldest entry (dicts keep insertion order)
+                self._data.pop(next(iter(self._data)), None)
+            expires = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+            self._data[key] = (expires, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+
+# metal id -> name. Metals are never edited through the API, but scripts/seed.py
+# truncates and reinserts them (reusing ids) from outside the process, so names
+# are only trusted for 5 minutes; unknown ids are looked up on first use.
+_metal_names = TTLCache(ttl=300)
+
+
+def metal_name(db: Session, metal_id: int) -> str | None:
+    name = _metal_names.get(metal_id)
+    if name is None:
+        name = db.execute(select(models.Metal.name).where(models.Metal.id == metal_id)).scalar()
+        if name is not None:
+            _metal_names.set(metal_id, name)
+    return name
+
+
+async def metal_name_async(db: AsyncSession, metal_id: int) -> str | None:
+    name = _metal_names.get(metal_id)
+    if name is None:
+        name = (await db.execute(select(models.Metal.name).where(models.Metal.id == metal_id))).scalar()
+        if name is not None:
+            _metal_names.set(metal_id, name)
+    return name
+
+
+def json_snapshot(value: Any) -> tuple[str, bytes]:
+    """Encode `value` once and tag it with a hash of the bytes, so the ETag changes iff the body does."""
+    body = orjson.dumps(value)
+    return f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"', body
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """True when an If-None-Match header already names `etag` (or is '*')."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+# /reports/transit — cleared when a tree enters or leaves transit
+transit_summary = TTLCache(ttl=30)
+# /reports/scrap_loss/summary — cleared when a reconciliation is confirmed
+scrap_loss_summary = TTLCache(ttl=30)
+# /scrap/reserves — cleared on every reserve write (prep, supply, recon, adjust);
+# the short TTL bounds staleness after writes made outside the API (seed, manual top-ups)
+scrap_reserves = TTLCache(ttl=10)
+# /supply/queue, keyed on the search term — cleared on metal prep and supply posts
+supply_queue = TTLCache(ttl=2, maxsize=64)
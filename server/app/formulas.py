@@ -1,61 +1,72 @@
+import re
 from datetime import timedelta
+from functools import lru_cache
 from decimal import Decimal
+from typing import NamedTuple
 
 
 # server/app/formulas.py
-def est_metal_weight(tree_weight: float, metal_name: str) -> float:
-    """Estimate metal weight directly from tree weight (no gasket)."""
-    factor = 1.0
+class MetalSpec(NamedTuple):
+    weight_factor: float   # tree (wax) weight -> metal weight
+    purity: float          # fine fraction of the metal
+    casting_temp: float
+    oven_temp: float
+    quench_min: int
+
+
+# Keyed by the normalized metal token (see _normalize). Bare karat keys cover
+# names without a colour letter (e.g. "14K").
+_METAL_SPECS: dict[str, MetalSpec] = {
+    "10":       MetalSpec(11,    0.417, 1100.0, 1100.0, 1),
+    "10W":      MetalSpec(11,    0.417, 1100.0, 1100.0, 15),
+    "10Y":      MetalSpec(11,    0.417, 1100.0, 1100.0, 15),
+    "10R":      MetalSpec(11,    0.417, 1100.0, 1100.0, 8),
+    "14":       MetalSpec(13.25, 0.587, 1000.0, 1000.0, 1),
+    "14W":      MetalSpec(13.25, 0.587, 1050.0, 1150.0, 15),
+    "14Y":      MetalSpec(13.25, 0.587, 1030.0, 1050.0, 15),
+    "14R":      MetalSpec(13.25, 0.587, 1100.0, 1050.0, 7),
+    "18":       MetalSpec(16.5,  0.752, 1000.0, 1000.0, 1),
+    "18W":      MetalSpec(16.5,  0.752, 1050.0, 1050.0, 15),
+    "18Y":      MetalSpec(16.5,  0.752, 1060.0, 1050.0, 15),
+    "18R":      MetalSpec(16.5,  0.752, 1100.0, 1020.0, 3),
+    "PLATINUM": MetalSpec(21,    1,     1000.0, 1000.0, 8),
+    "SILVER":   MetalSpec(11,    1,     980.0,  980.0,  15),
+}
+_DEFAULT_SPEC = MetalSpec(1.0, 1, 1000.0, 1000.0, 1)
+
+_METAL_RE = re.compile(r"1[048][WYR]?|PLATINUM|SILVER")
+
+
+def _normalize(metal_name: str | None) -> str:
+    """Uppercase once and extract the metal token ("14W", "PLATINUM", ...)."""
     name = (metal_name or "").upper()
+    # seeded metal names ("14W", "Platinum") are table keys already: one hash probe
+    if name in _METAL_SPECS:
+        return name
+    m = _METAL_RE.search(name)
+    return m.group(0) if m else ""
 
-    if "10" in name:
-        factor = 11
-    elif "14" in name:
-        factor = 13.25
-    elif "18" in name:
-        factor = 16.5
-    elif "PLATINUM" in name:
-        factor = 21
-    elif "SILVER" in name:
-        factor = 11
 
-    return round((tree_weight) * factor, 3)
+@lru_cache(maxsize=64)
+def metal_spec(metal_name: str | None) -> MetalSpec:
+    """All per-metal constants in a single lookup (memoized per name; MetalSpec is immutable)."""
+    return _METAL_SPECS.get(_normalize(metal_name), _DEFAULT_SPEC)
 
 
-def calc_metal_weight(gasket_weight: float, tree_weight: float, metal_name: str) -> float:
+def est_metal_weight(tree_weight: float, metal_name: str) -> float:
+    """Estimate metal weight directly from tree weight (no gasket)."""
+    return round((tree_weight) * metal_spec(metal_name).weight_factor, 3)
 
-    wax_weight = tree_weight - gasket_weight
 
-    factor = 1.0
+def calc_metal_weight(gasket_weight: float, tree_weight: float, metal_name: str) -> float:
 
-    if "10" in metal_name.upper(): 
-        factor = 11
-    elif "14" in metal_name.upper():
-        factor = 13.25
-    elif "18" in metal_name.upper():
-        factor = 16.5
-    elif "PLATINUM" in metal_name.upper():
-        factor = 21
-    elif "SILVER" in metal_name.upper():
-        factor = 11
+    wax_weight = tree_weight - gasket_weight
 
-    return round((wax_weight) * factor, 3)
+    return round((wax_weight) * metal_spec(metal_name).weight_factor, 3)
 
 def calc_alloy_for(metal_name: str, total_metal: float):
 
-    pure, alloy = 0
-    factor = 1
-
-    if "10" in metal_name.upper(): 
-        factor = 0.417 
-    elif "14" in metal_name.upper():
-        factor = 0.587
-    elif "18" in metal_name.upper():
-        factor = 0.752
-    elif "PLATINUM" in metal_name.upper():
-        factor = 1
-    elif "SILVER" in metal_name.upper():
-        factor = 1
+    factor = metal_spec(metal_name).purity
 
     pure = factor * total_metal
     alloy = total_metal - pure
@@ -63,84 +74,14 @@ def calc_alloy_for(metal_name: str, total_metal: float):
     return pure, alloy
 
 def casting_temp_for(metal_name: str) -> float:
-
-    temp = 1000
-
-    if "10" in metal_name.upper(): 
-        temp = 1100
-    elif "14W" in metal_name.upper():
-        temp = 1050
-    elif "14Y" in metal_name.upper():
-        temp = 1030
-    elif "14R" in metal_name.upper():
-        temp = 1100
-    elif "SILVER" in metal_name.upper():
-        temp = 980
-    elif "18W" in metal_name.upper():
-        temp = 1050
-    elif "18Y" in metal_name.upper():
-        temp = 1060
-    elif "18R" in metal_name.upper():
-        temp = 1100
-    elif "PLATINUM" in metal_name.upper():
-        temp = 1000
-
-    return temp
-
+    return metal_spec(metal_name).casting_temp
 
 
 def oven_temp_for(metal_name: str) -> float:
-    temp = 1000
-
-    if "10" in metal_name.upper(): 
-        temp = 1100
-    elif "14W" in metal_name.upper():
-        temp = 1150
-    elif "14Y" in metal_name.upper():
-        temp = 1050
-    elif "14R" in metal_name.upper():
-        temp = 1050
-    elif "SILVER" in metal_name.upper():
-        temp = 980
-    elif "18W" in metal_name.upper():
-        temp = 1050
-    elif "18Y" in metal_name.upper():
-        temp = 1050
-    elif "18R" in metal_name.upper():
-        temp = 1020
-    elif "PLATINUM" in metal_name.upper():
-        temp = 1000
-
-    return temp
+    return metal_spec(metal_name).oven_temp
 
 def quenching_minutes_for(metal_name: str) -> int:
-
-    mins = 1
-
-    if "10W" in metal_name.upper(): 
-        mins = 15
-    elif "10Y" in metal_name.upper(): 
-        mins = 15
-    elif "10R" in metal_name.upper(): 
-        mins = 8
-    elif "14W" in metal_name.upper():
-        mins = 15
-    elif "14Y" in metal_name.upper():
-        mins = 15
-    elif "14R" in metal_name.upper():
-        mins = 7
-    elif "SILVER" in metal_name.upper():
-        mins = 15
-    elif "18W" in metal_name.upper():
-        mins = 15
-    elif "18Y" in metal_name.upper():
-        mins = 15
-    elif "18R" in metal_name.upper():
-        mins = 3
-    elif "PLATINUM" in metal_name.upper():
-        mins = 8
-
-    return mins
+    return metal_spec(metal_name).quench_min
 
 def ready_at(casting_completed_at, quench_min):
     return casting_completed_at + timedelta(minutes=quench_min)
@@ -1,14 +1,31 @@
 from decimal import Decimal
 from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import TIMESTAMP, String, Enum, Date, DateTime, ForeignKey, UniqueConstraint, Numeric
-from sqlalchemy import Table, Column, Integer, func
+from sqlalchemy import TIMESTAMP, String, Enum, Date, DateTime, ForeignKey, UniqueConstraint, Numeric, Index
+from sqlalchemy import Table, Column, Integer, func, DDL, event, Computed
 
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 import enum
 from .db import Base
 from sqlalchemy.sql import func
 
+# trigram GIN indexes (substring ILIKE search) need the pg_trgm extension
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+def _trgm_index(name: str, column: str) -> Index:
+    """GIN trigram index so `col ILIKE '%q%'` can use an index on Postgres."""
+    return Index(name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"})
+
+
+def utcnow() -> datetime:
+    """Naive UTC "now" for the TIMESTAMP WITHOUT TIME ZONE columns (datetime.utcnow is deprecated)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 # models.py
 class Stage(str, enum.Enum):
     waxing = "waxing"
@@ -44,7 +61,11 @@ class Tree(Base):
     posted_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     posted_by: Mapped[str] = mapped_column(String(64), nullable=False)
 
-    __table_args__ = (UniqueConstraint('tree_no', name='uq_tree_no'),)
+    __table_args__ = (
+        UniqueConstraint('tree_no', name='uq_tree_no'),
+        Index("ix_trees_status_date_metal", "status", "date", "metal_id"),
+        _trgm_index("ix_trees_tree_no_trgm", "tree_no"),
+    )
     bags = relationship("Bag", secondary="tree_bags", back_populates="trees")
 
 
@@ -61,12 +82,19 @@ class Flask(Base):
     flask_no: Mapped[str] = mapped_column(String(32))
     metal_id: Mapped[int] = mapped_column(ForeignKey("metals.id"))
     status: Mapped[Stage] = mapped_column(Enum(Stage), default=Stage.waxing)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, onupdate=utcnow)
     tree_id: Mapped[Optional[int]] = mapped_column(ForeignKey("trees.id"), nullable=True)
 
     metal = relationship("Metal")
-    __table_args__ = (UniqueConstraint("date", "flask_no", name="uq_date_flask"),)
+    __table_args__ = (
+        UniqueConstraint("date", "flask_no", name="uq_date_flask"),
+        # queue/search endpoints filter by stage + date range (+ metal) and sort by date
+        Index("ix_flasks_status_date_metal", "status", "date", "metal_id"),
+        # transit search probes "is there a live flask for this tree?"
+        Index("ix_flasks_tree_id", "tree_id"),
+        _trgm_index("ix_flasks_flask_no_trgm", "flask_no"),
+    )
     waxingentry = relationship("WaxingEntry", uselist=False, back_populates="flask")
     casting = relationship("Casting", uselist=False, back_populates="flask")
     quenching_rel = relationship("Quenching", uselist=False, back_populates="flask")
@@ -78,6 +106,7 @@ class Bag(Base):
     id = Column(Integer, primary_key=True)
     bag_no = Column(String(64), unique=True, nullable=False, index=True)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
+    __table_args__ = (_trgm_index("ix_bags_bag_no_trgm", "bag_no"),)
 
     # backrefs populated below
     trees = relationship("Tree", secondary="tree_bags", back_populates="bags")
@@ -106,10 +135,10 @@ class WaxingEntry(Base):
     __tablename__ = "waxing_entries"
     id: Mapped[int] = mapped_column(primary_key=True)
     flask_id: Mapped[int] = mapped_column(ForeignKey("flasks.id"), unique=True)
-    gasket_weight: Mapped[float] = mapped_column(Numeric(12, 3))
-    tree_weight: Mapped[float] = mapped_column(Numeric(12, 3))
-    metal_weight: Mapped[float] = mapped_column(Numeric(12, 3))
-    posted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    gasket_weight: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    tree_weight: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    metal_weight: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    posted_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
     posted_by: Mapped[str] = mapped_column(String(64))
 
     flask = relationship("Flask", back_populates="waxingentry")
@@ -128,7 +157,7 @@ class MetalPrep(Base):
     alloy_planned: Mapped[float] = mapped_column(Numeric(12, 3), default=0)
     pure_planned: Mapped[float] = mapped_column(Numeric(12, 3), default=0)
 
-    posted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    posted_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
     posted_by: Mapped[str] = mapped_column(String(64))
 
     flask = relationship("Flask")
@@ -138,12 +167,12 @@ class Supply(Base):
     __tablename__ = "metal_supply"
     id: Mapped[int] = mapped_column(primary_key=True)
     flask_id: Mapped[int] = mapped_column(ForeignKey("flasks.id"), unique=True)
-    required_metal_weight: Mapped[float] = mapped_column(Numeric(12, 3))
-    scrap_supplied: Mapped[float] = mapped_column(Numeric(12, 3))
-    fine_24k_supplied: Mapped[float] = mapped_column(Numeric(12, 3), default=0)
-    alloy_supplied: Mapped[float] = mapped_column(Numeric(12, 3), default=0)
-    fresh_supplied: Mapped[float] = mapped_column(Numeric(12, 3), default=0)
-    posted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    required_metal_weight: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    scrap_supplied: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    fine_24k_supplied: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False), default=0)
+    alloy_supplied: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False), default=0)
+    fresh_supplied: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False), default=0)
+    posted_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
     posted_by: Mapped[str] = mapped_column(String(64))
     flask = relationship("Flask")
 
@@ -151,8 +180,8 @@ class Casting(Base):
     __tablename__ = "casting"
     id: Mapped[int] = mapped_column(primary_key=True)
     flask_id: Mapped[int] = mapped_column(ForeignKey("flasks.id"), unique=True)
-    casting_temp: Mapped[float] = mapped_column(Numeric(8, 2))
-    oven_temp: Mapped[float] = mapped_column(Numeric(8, 2))
+    casting_temp: Mapped[float] = mapped_column(Numeric(8, 2, asdecimal=False))
+    oven_temp: Mapped[float] = mapped_column(Numeric(8, 2, asdecimal=False))
     completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     posted_by: Mapped[str] = mapped_column(String(64))
 
@@ -164,20 +193,24 @@ class Quenching(Base):
     flask_id: Mapped[int] = mapped_column(ForeignKey("flasks.id"), unique=True)
     quenching_time_min: Mapped[int] = mapped_column()
     ready_at: Mapped[datetime] = mapped_column(DateTime)
-    posted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    posted_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
     posted_by: Mapped[str] = mapped_column(String(64))
 
     flask = relationship("Flask", back_populates="quenching_rel")
+    __table_args__ = (
+        # auto-quenching sweep: range scan on ready_at, flask_id read from the index
+        Index("ix_quenching_ready_at", "ready_at", postgresql_include=["flask_id"]),
+    )
 
 class Cutting(Base):
     __tablename__ = "cutting"
     id: Mapped[int] = mapped_column(primary_key=True)
     flask_id: Mapped[int] = mapped_column(ForeignKey("flasks.id"), unique=True)
-    before_cut_A: Mapped[float] = mapped_column(Numeric(12, 3))
-    after_scrap_B: Mapped[float] = mapped_column(Numeric(12, 3))
-    after_casting_C: Mapped[float] = mapped_column(Numeric(12, 3))
-    loss: Mapped[float] = mapped_column(Numeric(12, 3))
-    posted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    before_cut_A: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    after_scrap_B: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    after_casting_C: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    loss: Mapped[float] = mapped_column(Numeric(12, 3, asdecimal=False))
+    posted_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
     posted_by: Mapped[str] = mapped_column(String(64))
 
     flask = relationship("Flask", back_populates="cutting_rel")
@@ -196,7 +229,7 @@ class ScrapMovement(Base):
     flask_id: Mapped[int | None]
     delta: Mapped[float] = mapped_column(Numeric(12, 3))
     source: Mapped[str] = mapped_column(String(32))  # supply.consume / cutting.add
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
     created_by: Mapped[str] = mapped_column(String(64))
 
 class Reconciliation(Base):
@@ -210,14 +243,14 @@ class Reconciliation(Base):
     after_cast_weight: Mapped[Decimal]   = mapped_column(Numeric(12,3), nullable=False)
     after_scrap_weight: Mapped[Decimal]  = mapped_column(Numeric(12,3), nullable=False)
 
-    # derived preview saved for convenience (optional)
-    loss_part_i: Mapped[Decimal]         = mapped_column(Numeric(12,3), nullable=False)   # supplied - before_cut
-    loss_part_ii: Mapped[Decimal]        = mapped_column(Numeric(12,3), nullable=False)   # before_cut - (after_cast+after_scrap)
-    loss_total: Mapped[Decimal]          = mapped_column(Numeric(12,3), nullable=False)   # supplied - after_cast - after_scrap
+    # derived by the database (GENERATED ... STORED); never written by the app
+    loss_part_i: Mapped[Decimal]         = mapped_column(Numeric(12,3), Computed("supplied_weight - before_cut_weight", persisted=True))
+    loss_part_ii: Mapped[Decimal]        = mapped_column(Numeric(12,3), Computed("before_cut_weight - (after_cast_weight + after_scrap_weight)", persisted=True))
+    loss_total: Mapped[Decimal]          = mapped_column(Numeric(12,3), Computed("supplied_weight - after_cast_weight - after_scrap_weight", persisted=True))
 
     notes: Mapped[str | None]            = mapped_column(String(256))
     posted_by: Mapped[str]               = mapped_column(String(64))
-    created_at: Mapped[datetime]         = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at: Mapped[datetime]         = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at: Mapped[datetime]         = mapped_column(DateTime, default=utcnow, nullable=False)
+    updated_at: Mapped[datetime]         = mapped_column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
 
     flask = relationship("Flask")
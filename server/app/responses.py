@@ -0,0 +1,12 @@
+# server/app/responses.py
+import orjson
+from fastapi import Response
+
+
+def json_response(content) -> Response:
+    """
+    Encode `content` with orjson and send the bytes as-is. Returning a Response
+    skips FastAPI's jsonable_encoder walk over the payload, so hot list endpoints
+    can hand dates, datetimes and floats straight to the encoder (no Decimals).
+    """
+    return Response(orjson.dumps(content), media_type="application/json")
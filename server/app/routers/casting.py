@@ -1,67 +1,77 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from sqlalchemy import select
-from ..db import get_db
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..db import get_async_db
 from .. import models, formulas
 from ..websockets import manager
+from ..services.auto_quenching import schedule_sweep
 
 router = APIRouter(prefix="/casting", tags=["casting"])
 
 @router.post("/{flask_id}/complete")
-async def complete_casting(flask_id: int, payload: dict, db: Session = Depends(get_db)):
-    flask = db.get(models.Flask, flask_id)
-    if not flask or flask.status != models.Stage.casting:
+async def complete_casting(flask_id: int, payload: dict, db: AsyncSession = Depends(get_async_db)):
+    # flask + metal in one SELECT; the stage check rides along in the WHERE
+    flask = (await db.execute(
+        select(models.Flask)
+        .options(joinedload(models.Flask.metal))
+        .where(models.Flask.id == flask_id, models.Flask.status == models.Stage.casting)
+    )).scalar_one_or_none()
+    if not flask:
         raise HTTPException(400, "flask not in casting stage")
 
     # lookup metal
     metal = flask.metal
-    casting_temp = formulas.casting_temp_for(metal.name)
-    oven_temp = formulas.oven_temp_for(metal.name)
+    _, _, casting_temp, oven_temp, q_minutes = formulas.metal_spec(metal.name)
 
-    existing = db.execute(select(models.Casting).where(models.Casting.flask_id == flask.id)).scalar_one_or_none()
-    now = datetime.utcnow()
-    if existing:
-        existing.casting_temp = casting_temp
-        existing.oven_temp = oven_temp
-        existing.completed_at = now
-        existing.posted_by = payload.get("posted_by", "system")
-    else:
-        db.add(models.Casting(
-            flask_id=flask.id,
-            casting_temp=casting_temp,
-            oven_temp=oven_temp,
-            completed_at=now,
-            posted_by=payload.get("posted_by", "system")
-        ))
-
-    q_minutes = formulas.quenching_minutes_for(metal.name)
+    now = models.utcnow()
+    posted_by = payload.get("posted_by", "system")
     ready_at_dt = formulas.ready_at(now, q_minutes)
 
-    existing_q = db.execute(
-        select(models.Quenching).where(models.Quenching.flask_id == flask.id)
-    ).scalar_one_or_none()
+    # one round-trip each: INSERT ... ON CONFLICT (flask_id) DO UPDATE
+    casting_stmt = pg_insert(models.Casting).values(
+        flask_id=flask.id,
+        casting_temp=casting_temp,
+        oven_temp=oven_temp,
+        completed_at=now,
+        posted_by=posted_by,
+    )
+    await db.execute(casting_stmt.on_conflict_do_update(
+        index_elements=[models.Casting.flask_id],
+        set_={
+            "casting_temp": casting_stmt.excluded.casting_temp,
+            "oven_temp": casting_stmt.excluded.oven_temp,
+            "completed_at": casting_stmt.excluded.completed_at,
+            "posted_by": casting_stmt.excluded.posted_by,
+        },
+    ))
+
+    quench_stmt = pg_insert(models.Quenching).values(
+        flask_id=flask.id,
+        quenching_time_min=q_minutes,
+        ready_at=ready_at_dt,
+        posted_by=posted_by,
+    )
+    await db.execute(quench_stmt.on_conflict_do_update(
+        index_elements=[models.Quenching.flask_id],
+        set_={
+            "quenching_time_min": quench_stmt.excluded.quenching_time_min,
+            "ready_at": quench_stmt.excluded.ready_at,
+            "posted_by": quench_stmt.excluded.posted_by,
+        },
+    ))
 
-    if existing_q:
-        existing_q.quenching_time_min = q_minutes
-        existing_q.ready_at = ready_at_dt
-        existing_q.posted_by = payload.get("posted_by", "system")
-    else:
-        db.add(models.Quenching(
-            flask_id=flask.id,
-            quenching_time_min=q_minutes,
-            ready_at=ready_at_dt,
-            posted_by=payload.get("posted_by", "system")
-        ))
-        
     flask.status = models.Stage.quenching
     flask.updated_at = now
-    db.commit()
+    await db.commit()
+
+    schedule_sweep(q_minutes * 60)
 
-    await manager.broadcast({"event": "casting_complete", "flask_id": flask.id})
+    manager.broadcast_nowait({"event": "casting_complete", "flask_id": flask.id})
     return {
         "flask_id": flask.id,
-        "casting_temp": float(casting_temp),
-        "oven_temp": float(oven_temp),
-        "completed_at": now.isoformat()
+        "casting_temp": casting_temp,
+        "oven_temp": oven_temp,
+        "completed_at": now
     }
@@ -1,10 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select
-from datetime import datetime
-from decimal import Decimal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from ..db import get_db
+from ..db import get_async_db
 from .. import models, schemas
 from ..websockets import manager
 
@@ -12,7 +11,7 @@ router = APIRouter(prefix="/cutting", tags=["cutting"])
 
 
 @router.post("")
-async def post_cutting(payload: schemas.CuttingCreate, db: Session = Depends(get_db)):
+async def post_cutting(payload: schemas.CuttingCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Cutting now STAGES the result to Reconciliation (no reserve/loss side-effects here).
     Expected payload:
@@ -27,15 +26,24 @@ async def post_cutting(payload: schemas.CuttingCreate, db: Session = Depends(get
     if payload.flask_id is None:
         raise HTTPException(422, "flask_id required")
 
-    flask = db.get(models.Flask, payload.flask_id)
+    # flask + its supply row in one round-trip
+    # lambda_stmt: the statement is built and cache-keyed once; flask_id binds per call
+    flask_id = payload.flask_id
+    row = (await db.execute(lambda_stmt(
+        lambda: select(models.Flask, models.Supply)
+        .outerjoin(models.Supply, models.Supply.flask_id == models.Flask.id)
+        .where(models.Flask.id == flask_id)
+    ))).first()
+    flask, sup_row = row if row else (None, None)
     if not flask or flask.status != models.Stage.cutting:
         raise HTTPException(400, "Flask not in cutting stage")
 
     # basic input validation (strong checks will happen at Reconciliation)
+    # plain floats: everything is stored as Numeric(12, 3), so Decimal buys nothing here
     try:
-        A = Decimal(str(payload.before_cut_A or 0))
-        B = Decimal(str(payload.after_scrap_B or 0))
-        C = Decimal(str(payload.after_casting_C or 0))
+        A = float(payload.before_cut_A or 0)
+        B = float(payload.after_scrap_B or 0)
+        C = float(payload.after_casting_C or 0)
     except Exception:
         raise HTTPException(400, "Invalid numeric values")
 
@@ -43,118 +51,111 @@ async def post_cutting(payload: schemas.CuttingCreate, db: Session = Depends(get
         raise HTTPException(400, "Weights must be >= 0")
 
     # --- Compute supplied weight from Supply (scrap + fine24k/pure + alloy)
-    sup_row = db.execute(
-        select(models.Supply).where(models.Supply.flask_id == flask.id)
-    ).scalar_one_or_none()
-
-    supplied = Decimal("0.000")
+    supplied = 0.0
     if sup_row:
-        supplied += Decimal(str(getattr(sup_row, "scrap_supplied", 0) or 0))
+        supplied += float(getattr(sup_row, "scrap_supplied", 0) or 0)
         # 'fine_24k_supplied' for gold; 'pure_supplied' for Pt/Ag (fallback)
         fine_or_pure = getattr(sup_row, "fine_24k_supplied", None)
         if fine_or_pure is None:
             fine_or_pure = getattr(sup_row, "pure_supplied", 0)
-        supplied += Decimal(str(fine_or_pure or 0))
-        supplied += Decimal(str(getattr(sup_row, "alloy_supplied", 0) or 0))
+        supplied += float(fine_or_pure or 0)
+        supplied += float(getattr(sup_row, "alloy_supplied", 0) or 0)
+        supplied = round(supplied, 3)
 
     # --- 5% validations --------------------------------------------------------
     # 1) A (before_cut) must be within 5% of supplied
-    if supplied <= Decimal('0'):
+    if supplied <= 0:
         raise HTTPException(400, "No supplied weight found for this flask. Supply before cutting.")
     delta_as = abs(A - supplied)
-    if delta_as > (supplied * Decimal('0.05')):
+    if delta_as > supplied * 0.05:
         raise HTTPException(
             400,
-            f"Before-cut weight must be within 5% of supplied ({float(supplied):.3f}). "
-            f"Got before={float(A):.3f}, supplied={float(supplied):.3f}."
+            f"Before-cut weight must be within 5% of supplied ({supplied:.3f}). "
+            f"Got before={A:.3f}, supplied={supplied:.3f}."
         )
 
     # 2) (B+C) must be within 5% of A
     delta_bc = abs((B + C) - A)
-    if A > Decimal('0') and delta_bc > (A * Decimal('0.05')):
+    if A > 0 and delta_bc > A * 0.05:
         raise HTTPException(
             400,
             "Sum of after-cut weights (casting + scrap) must be within 5% of before-cut weight. "
-            f"Got before={float(A):.3f}, after_sum={float(B+C):.3f}."
+            f"Got before={A:.3f}, after_sum={B+C:.3f}."
         )
     # (scrap loss can be negative; we do not block that)
 
-    # loss components for preview (final checks will be at Recon)
-    loss_i = supplied - A                               # (i) supplied - before
-    loss_ii = A - (B + C)                               # (ii) before - (after_cast + after_scrap)
-    loss_total = supplied - (B + C)                     # (i) + (ii)
+    # loss components for preview (final checks will be at Recon);
+    # rounded once to the columns' 3 decimals so float noise never shows
+    loss_i = round(supplied - A, 3)                     # (i) supplied - before
+    loss_ii = round(A - (B + C), 3)                     # (ii) before - (after_cast + after_scrap)
+    loss_total = round(supplied - (B + C), 3)           # (i) + (ii)
 
-    now = datetime.utcnow()
+    now = models.utcnow()
     try:
         # Upsert Cutting row (so historical inputs remain visible)
-        cut = db.execute(
-            select(models.Cutting).where(models.Cutting.flask_id == flask.id)
-        ).scalar_one_or_none()
-        if cut:
-            cut.before_cut_A = float(A)
-            cut.after_scrap_B = float(B)
-            cut.after_casting_C = float(C)
-            # keep an informative preview value (will be finalized at recon)
-            cut.loss = float(loss_total)
-            cut.posted_at = now
-            cut.posted_by = payload.posted_by
-        else:
-            db.add(models.Cutting(
-                flask_id=flask.id,
-                before_cut_A=float(A),
-                after_scrap_B=float(B),
-                after_casting_C=float(C),
-                loss=float(loss_total),   # provisional; finalized at recon
-                posted_by=payload.posted_by,
-            ))
+        # INSERT ... ON CONFLICT (flask_id) DO UPDATE: one atomic statement per table
+        cut_stmt = pg_insert(models.Cutting).values(
+            flask_id=flask.id,
+            before_cut_A=A,
+            after_scrap_B=B,
+            after_casting_C=C,
+            loss=loss_total,   # provisional; finalized at recon
+            posted_at=now,
+            posted_by=payload.posted_by,
+        )
+        await db.execute(cut_stmt.on_conflict_do_update(
+            index_elements=[models.Cutting.flask_id],
+            set_={
+                "before_cut_A": cut_stmt.excluded.before_cut_A,
+                "after_scrap_B": cut_stmt.excluded.after_scrap_B,
+                "after_casting_C": cut_stmt.excluded.after_casting_C,
+                "loss": cut_stmt.excluded.loss,
+                "posted_at": cut_stmt.excluded.posted_at,
+                "posted_by": cut_stmt.excluded.posted_by,
+            },
+        ))
 
         # Upsert Reconciliation staging record with SAME values
-        r = db.execute(
-            select(models.Reconciliation).where(models.Reconciliation.flask_id == flask.id)
-        ).scalar_one_or_none()
-        if r:
-            r.supplied_weight = float(supplied)
-            r.before_cut_weight = float(A)
-            r.after_cast_weight = float(C)
-            r.after_scrap_weight = float(B)
-            r.loss_part_i = float(loss_i)
-            r.loss_part_ii = float(loss_ii)
-            r.loss_total = float(loss_total)
-            r.posted_by = payload.posted_by
-            r.updated_at = now
-        else:
-            db.add(models.Reconciliation(
-                flask_id=flask.id,
-                supplied_weight=float(supplied),
-                before_cut_weight=float(A),
-                after_cast_weight=float(C),
-                after_scrap_weight=float(B),
-                loss_part_i=float(loss_i),
-                loss_part_ii=float(loss_ii),
-                loss_total=float(loss_total),
-                posted_by=payload.posted_by,
-            ))
+        recon_stmt = pg_insert(models.Reconciliation).values(
+            flask_id=flask.id,
+            supplied_weight=supplied,
+            before_cut_weight=A,
+            after_cast_weight=C,
+            after_scrap_weight=B,
+            posted_by=payload.posted_by,
+        )
+        await db.execute(recon_stmt.on_conflict_do_update(
+            index_elements=[models.Reconciliation.flask_id],
+            set_={
+                "supplied_weight": recon_stmt.excluded.supplied_weight,
+                "before_cut_weight": recon_stmt.excluded.before_cut_weight,
+                "after_cast_weight": recon_stmt.excluded.after_cast_weight,
+                "after_scrap_weight": recon_stmt.excluded.after_scrap_weight,
+                "posted_by": recon_stmt.excluded.posted_by,
+                "updated_at": now,   # onupdate= is not applied to ON CONFLICT updates
+            },
+        ))
 
         # Advance to reconciliation (NO scrap movement / NO final booking here)
         flask.status = models.Stage.reconciliation
         flask.updated_at = now
 
-        db.commit()
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
 
-    await manager.broadcast({"event": "cutting_staged", "flask_id": flask.id})
+    manager.broadcast_nowait({"event": "cutting_staged", "flask_id": flask.id})
     return {
         "flask_id": flask.id,
         "moved_to": "reconciliation",
         "preview": {
-            "supplied": float(supplied),
-            "before": float(A),
-            "after_cast": float(C),
-            "after_scrap": float(B),
-            "loss_i": float(loss_i),
-            "loss_ii": float(loss_ii),
-            "loss_total": float(loss_total),
+            "supplied": supplied,
+            "before": A,
+            "after_cast": C,
+            "after_scrap": B,
+            "loss_i": loss_i,
+            "loss_ii": loss_ii,
+            "loss_total": loss_total,
         },
     }
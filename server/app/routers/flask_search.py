@@ -5,28 +5,29 @@ from datetime import date
 from typing import Any, Dict, List, Optional
 from collections import defaultdict
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import String, case, cast, func, literal, null, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import get_db
+from ..db import AsyncSessionLocal, get_async_db
 from .. import models
+from ..responses import json_response
 
 router = APIRouter(prefix="/search", tags=["flask_search"])
 
+CSV_BATCH = 500  # export rows per streamed chunk
 
-def _stage_order_value(stage: str) -> int:
-    order = {
-        "transit": 0,
-        "metal_prep": 1,
-        "supply": 2,
-        "casting": 3,
-        "quenching": 4,
-        "cutting": 5,
-        "reconciliation": 6,
-        "done": 7,
-    }
-    return order.get(stage, 99)
+
+_STAGE_ORDER = {
+    "transit": 0,
+    "metal_prep": 1,
+    "supply": 2,
+    "casting": 3,
+    "quenching": 4,
+    "cutting": 5,
+    "reconciliation": 6,
+    "done": 7,
+}
 
 
 def _bag_model_and_col(models_module):
@@ -42,22 +43,41 @@ def _bag_model_and_col(models_module):
     return Bag, None
 
 
-@router.get("/flasks")
-def search_flasks(
-    db: Session = Depends(get_db),
-    stage: Optional[str] = Query(
-        "active",
-        description="active (=not done), or one of: transit, metal_prep, supply, casting, quenching, cutting, reconciliation, done; use 'all' to disable stage filter",
-    ),
-    date_from: Optional[date] = None,
-    date_to: Optional[date] = None,
-    metal: Optional[str] = None,
-    q: Optional[str] = Query(None, description="search by flask_no / tree_no / bag number"),
-) -> List[Dict[str, Any]]:
+# models never change at runtime: resolve the bag table/column once at import
+FlaskBags = getattr(models, "flask_bags", None)
+TreeBags = getattr(models, "tree_bags", None)
+Bag, BAG_COL = _bag_model_and_col(models)
+
+
+def _like_pattern(q: str) -> str:
+    """Substring pattern for ILIKE with %, _ and the escape char taken literally."""
+    q = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{q}%"
+
+
+def _bag_owner_ids(owner_col, link, pat: str):
+    """Subquery: owner ids (flask_id / tree_id) having a bag that matches `pat`."""
+    return (
+        select(owner_col)
+        .select_from(link.join(Bag, Bag.id == link.c.bag_id))
+        .where(BAG_COL.ilike(pat, escape="\\"))
+    )
+
+
+def _search_stmts(stage, date_from, date_to, metal, q):
+    """
+    (flask statement, transit-tree statement) for a search; either is None when
+    the stage filter rules that kind out. Raises 400 for an unknown stage.
+    """
     F, T, M, W = models.Flask, models.Tree, models.Metal, models.WaxingEntry
 
+    # q is matched in SQL (trigram-indexed on Postgres), not on assembled rows
+    s = (q or "").strip()
+    pat = _like_pattern(s) if s else None
+    bag_search = pat is not None and Bag is not None and BAG_COL is not None
+
     # -------------------- FLASKS --------------------
-    f_rows: List[Any] = []
+    f_stmt = None
     if stage != "transit":  # <- transit is trees-only; skip querying flasks
         f_stmt = (
             select(
@@ -92,11 +112,16 @@ def search_flasks(
             f_stmt = f_stmt.where(F.date <= date_to)
         if metal:
             f_stmt = f_stmt.where(M.name == metal)
-
-        f_rows = db.execute(f_stmt).all()
+        if pat:
+            hits = [F.flask_no.ilike(pat, escape="\\"), T.tree_no.ilike(pat, escape="\\")]
+            if bag_search and FlaskBags is not None:
+                hits.append(F.id.in_(_bag_owner_ids(FlaskBags.c.flask_id, FlaskBags, pat)))
+            if bag_search and TreeBags is not None:
+                hits.append(F.tree_id.in_(_bag_owner_ids(TreeBags.c.tree_id, TreeBags, pat)))
+            f_stmt = f_stmt.where(or_(*hits))
 
     # -------------------- TREES without a flask (TRANSIT) --------------------
-    t_rows: List[Any] = []
+    t_stmt = None
     if stage in (None, "", "all", "active", "transit"):
         sub = select(F.id).where(F.tree_id == T.id, F.status != models.Stage.done).exists()
         t_stmt = (
@@ -117,59 +142,90 @@ def search_flasks(
             t_stmt = t_stmt.where(T.date <= date_to)
         if metal:
             t_stmt = t_stmt.where(M.name == metal)
+        if pat:
+            hits = [T.tree_no.ilike(pat, escape="\\")]
+            if bag_search and TreeBags is not None:
+                hits.append(T.id.in_(_bag_owner_ids(TreeBags.c.tree_id, TreeBags, pat)))
+            t_stmt = t_stmt.where(or_(*hits))
 
-        t_rows = db.execute(t_stmt).all()
+    return f_stmt, t_stmt
 
-    # -------------------- BAG NUMBERS --------------------
-    FlaskBags = getattr(models, "flask_bags", None)
-    TreeBags = getattr(models, "tree_bags", None)
-    Bag, BAG_COL = _bag_model_and_col(models)
 
+async def _bag_lists(db: AsyncSession, flask_ids: list, tree_ids: list):
+    """(flask_id -> bag numbers, tree_id -> bag numbers) for the given owners."""
+    F = models.Flask
     bag_by_flask = defaultdict(list)
     bag_by_tree = defaultdict(list)
+    if Bag is None or BAG_COL is None:
+        return bag_by_flask, bag_by_tree
 
-    if Bag is not None and BAG_COL is not None:
-        flask_ids = [r.flask_id for r in f_rows]
-        if FlaskBags is not None and flask_ids:
-            fb_stmt = (
-                select(FlaskBags.c.flask_id, BAG_COL)
-                .select_from(FlaskBags.join(Bag, Bag.id == FlaskBags.c.bag_id))
-                .where(FlaskBags.c.flask_id.in_(flask_ids))
-                .order_by(BAG_COL.asc())
-            )
-            for fid, bag_text in db.execute(fb_stmt):
-                if bag_text:
-                    bag_by_flask[fid].append(str(bag_text))
-
-        tree_ids = set()
-        tree_ids.update([r.tree_id for r in f_rows if getattr(r, "tree_id", None) is not None])
-        tree_ids.update([getattr(r, "tree_id", None) for r in t_rows if getattr(r, "tree_id", None) is not None])
-        tree_ids.update([getattr(r, "tree_id", None) for r in t_rows])
-
-        if TreeBags is not None and tree_ids:
-            tb_stmt = (
-                select(TreeBags.c.tree_id, BAG_COL)
-                .select_from(TreeBags.join(Bag, Bag.id == TreeBags.c.bag_id))
-                .where(TreeBags.c.tree_id.in_(list(tree_ids)))
-                .order_by(BAG_COL.asc())
+    # Every (owner, bag) pair in one round-trip. A flask lists its own bags
+    # (src 0) and then its tree's bags (src 1); GROUP BY drops duplicates
+    # and ORDER BY MIN(src) keeps a bag at its first position.
+    parts = []
+    if FlaskBags is not None and flask_ids:
+        parts.append(
+            select(literal("flask").label("kind"), FlaskBags.c.flask_id.label("owner_id"),
+                   BAG_COL.label("bag_text"), literal(0).label("src"))
+            .select_from(FlaskBags.join(Bag, Bag.id == FlaskBags.c.bag_id))
+            .where(FlaskBags.c.flask_id.in_(flask_ids))
+        )
+    if TreeBags is not None and flask_ids:
+        parts.append(
+            select(literal("flask").label("kind"), F.id.label("owner_id"),
+                   BAG_COL.label("bag_text"), literal(1).label("src"))
+            .select_from(
+                F.__table__
+                .join(TreeBags, TreeBags.c.tree_id == F.tree_id)
+                .join(Bag, Bag.id == TreeBags.c.bag_id)
             )
-            for tid, bag_text in db.execute(tb_stmt):
-                if bag_text:
-                    bag_by_tree[tid].append(str(bag_text))
+            .where(F.id.in_(flask_ids))
+        )
+    if TreeBags is not None and tree_ids:
+        parts.append(
+            select(literal("tree").label("kind"), TreeBags.c.tree_id.label("owner_id"),
+                   BAG_COL.label("bag_text"), literal(0).label("src"))
+            .select_from(TreeBags.join(Bag, Bag.id == TreeBags.c.bag_id))
+            .where(TreeBags.c.tree_id.in_(tree_ids))
+        )
+
+    if parts:
+        u = union_all(*parts).subquery()
+        bag_stmt = (
+            select(u.c.kind, u.c.owner_id, u.c.bag_text)
+            .group_by(u.c.kind, u.c.owner_id, u.c.bag_text)
+            .order_by(func.min(u.c.src), u.c.bag_text)
+        )
+        for kind, owner_id, bag_text in await db.execute(bag_stmt):
+            if bag_text:
+                (bag_by_flask if kind == "flask" else bag_by_tree)[owner_id].append(str(bag_text))
+    return bag_by_flask, bag_by_tree
+
+
+@router.get("/flasks")
+async def search_flasks(
+    db: AsyncSession = Depends(get_async_db),
+    stage: Optional[str] = Query(
+        "active",
+        description="active (=not done), or one of: transit, metal_prep, supply, casting, quenching, cutting, reconciliation, done; use 'all' to disable stage filter",
+    ),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    metal: Optional[str] = None,
+    q: Optional[str] = Query(None, description="search by flask_no / tree_no / bag number"),
+) -> Response:
+    f_stmt, t_stmt = _search_stmts(stage, date_from, date_to, metal, q)
+    f_rows = (await db.execute(f_stmt)).all() if f_stmt is not None else []
+    t_rows = (await db.execute(t_stmt)).all() if t_stmt is not None else []
+    bag_by_flask, bag_by_tree = await _bag_lists(
+        db, [r.flask_id for r in f_rows], [r.tree_id for r in t_rows]
+    )
 
     # -------------------- Build unified results --------------------
     results: List[Dict[str, Any]] = []
 
     for r in f_rows:
-        seen, bags = set(), []
-        for btxt in bag_by_flask.get(r.flask_id, []):
-            if btxt not in seen:
-                seen.add(btxt); bags.append(btxt)
-        if getattr(r, "tree_id", None) is not None:
-            for btxt in bag_by_tree.get(r.tree_id, []):
-                if btxt not in seen:
-                    seen.add(btxt); bags.append(btxt)
-
+        bags = bag_by_flask.get(r.flask_id, [])
         results.append(
             {
                 "id": r.flask_id,
@@ -202,63 +258,103 @@ def search_flasks(
             }
         )
 
-    if q:
-        s = q.strip().lower()
-        def _hit(row: Dict[str, Any]) -> bool:
-            return any([
-                (row.get("flask_no") or "").lower().find(s) >= 0,
-                (row.get("tree_no") or "").lower().find(s) >= 0,
-                any((b.lower().find(s) >= 0) for b in row.get("bag_nos") or []),
-            ])
-        results = [r for r in results if _hit(r)]
-
+    # key= is evaluated once per row; every row dict carries all of these keys
+    order = _STAGE_ORDER
     results.sort(
         key=lambda r: (
-            _stage_order_value(str(r.get("stage"))),
-            r.get("date") or "",
-            (r.get("metal_name") or "").lower(),
-            str(r.get("flask_no") or ""),
+            order.get(r["stage"], 99),
+            r["date"] or "",
+            (r["metal_name"] or "").lower(),
+            r["flask_no"] or "",
         )
     )
-    return results
+    return json_response(results)
+
+
+def _export_stmt(f_stmt, t_stmt):
+    """
+    The search's flask and tree rows as one statement, sorted in SQL the way
+    search_flasks sorts its list (stage order, date, metal, flask no), so the
+    export can stream it. None when both kinds are filtered out.
+    """
+    parts = []
+    if f_stmt is not None:
+        f = f_stmt.subquery()
+        stage = cast(f.c.stage, String)
+        parts.append(select(
+            literal("flask").label("kind"), f.c.flask_id.label("owner_id"),
+            stage.label("stage"), case(_STAGE_ORDER, value=stage, else_=99).label("stage_rank"),
+            f.c.date, f.c.metal_name, f.c.flask_no, f.c.tree_no, f.c.metal_weight,
+        ))
+    if t_stmt is not None:
+        t = t_stmt.subquery()
+        parts.append(select(
+            literal("tree").label("kind"), t.c.tree_id.label("owner_id"),
+            literal("transit").label("stage"), literal(_STAGE_ORDER["transit"]).label("stage_rank"),
+            t.c.date, t.c.metal_name, cast(null(), String).label("flask_no"), t.c.tree_no, t.c.metal_weight,
+        ))
+    if not parts:
+        return None
+    u = union_all(*parts).subquery()
+    return select(u).order_by(
+        u.c.stage_rank, u.c.date, func.lower(u.c.metal_name), func.coalesce(u.c.flask_no, ""), u.c.owner_id
+    )
 
 
 @router.get("/flasks/export")
-def export_flasks_csv(
-    db: Session = Depends(get_db),
+async def export_flasks_csv(
+    db: AsyncSession = Depends(get_async_db),
     stage: Optional[str] = "active",
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     metal: Optional[str] = None,
     q: Optional[str] = None,
 ):
-    rows = search_flasks(db=db, stage=stage, date_from=date_from, date_to=date_to, metal=metal, q=q)
+    f_stmt, t_stmt = _search_stmts(stage, date_from, date_to, metal, q)
+    stmt = _export_stmt(f_stmt, t_stmt)
     import csv
     from io import StringIO
     from fastapi.responses import StreamingResponse
 
-    buf = StringIO()
-    writer = csv.DictWriter(
-        buf,
-        fieldnames=["date", "stage", "metal_name", "flask_no", "tree_no", "metal_weight", "bag_nos_text"],
-        extrasaction="ignore",
-    )
-    writer.writeheader()
-    for r in rows:
-        writer.writerow(
-            {
-                "date": r.get("date") or "",
-                "stage": r.get("stage") or "",
-                "metal_name": r.get("metal_name") or "",
-                "flask_no": r.get("flask_no") or "",
-                "tree_no": r.get("tree_no") or "",
-                "metal_weight": r.get("metal_weight") if r.get("metal_weight") is not None else "",
-                "bag_nos_text": ", ".join(r.get("bag_nos") or []),
-            }
-        )
-    buf.seek(0)
+    fieldnames = ["date", "stage", "metal_name", "flask_no", "tree_no", "metal_weight", "bag_nos_text"]
+
+    async def gen():
+        # Rows come off a server-side cursor CSV_BATCH at a time, in the same
+        # order as /search/flasks; each batch's bag numbers are one extra query.
+        # Own session: the request's session is closed before the body is sent.
+        buf = StringIO()
+        writer = csv.DictWriter(buf, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        yield buf.getvalue()
+        if stmt is None:
+            return
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=CSV_BATCH))
+            async for part in result.partitions():
+                buf.seek(0)
+                buf.truncate()
+                bag_by_flask, bag_by_tree = await _bag_lists(
+                    db,
+                    [r.owner_id for r in part if r.kind == "flask"],
+                    [r.owner_id for r in part if r.kind == "tree"],
+                )
+                for r in part:
+                    bags = (bag_by_flask if r.kind == "flask" else bag_by_tree).get(r.owner_id, [])
+                    writer.writerow(
+                        {
+                            "date": r.date.isoformat() if r.date else "",
+                            "stage": r.stage or "",
+                            "metal_name": r.metal_name or "",
+                            "flask_no": r.flask_no or "",
+                            "tree_no": r.tree_no or "",
+                            "metal_weight": float(r.metal_weight or 0.0),
+                            "bag_nos_text": ", ".join(bags),
+                        }
+                    )
+                yield buf.getvalue()
+
     return StreamingResponse(
-        iter([buf.getvalue()]),
+        gen(),
         media_type="text/csv",
         headers={"Content-Disposition": 'attachment; filename="flask_search.csv"'},
     )
@@ -2,16 +2,22 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, conint, confloat  # local model to avoid schema drift
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, insert, lambda_stmt, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import datetime
+from functools import lru_cache
 
-from ..db import get_db
-from .. import models
+from ..db import get_db, get_async_db
+from .. import cache, models
 from ..websockets import manager
 
 
 router = APIRouter(prefix="/metal-prep", tags=["metal-prep"])
 
+_MISSING = object()
+
 
 class MetalPrepPost(BaseModel):
     flask_id: conint(gt=0)                          # type: ignore
@@ -23,6 +29,7 @@ class MetalPrepPost(BaseModel):
     posted_by: str
 
 
+@lru_cache(maxsize=32)
 def _rule_for_metal(name: str | None):
     """
     Decide rule set for a given metal name.
@@ -51,7 +58,6 @@ def get_preset(flask_id: int, db: Session = Depends(get_db)):
     if not flask:
         raise HTTPException(status_code=404, detail="Flask not found")
 
-    metal = db.get(models.Metal, flask.metal_id)
 
     waxing = db.execute(
         select(models.WaxingEntry).where(models.WaxingEntry.flask_id == flask.id)
@@ -66,7 +72,7 @@ def get_preset(flask_id: int, db: Session = Depends(get_db)):
         "flask_no": flask.flask_no,
         "date": flask.date.isoformat() if flask.date else None,
         "metal_id": flask.metal_id,
-        "metal_name": metal.name if metal else None,
+        "metal_name": cache.metal_name(db, flask.metal_id),
         "required_metal_weight": float(waxing.metal_weight) if waxing else 0.0,
         "prepared": bool(prep.prepared) if prep else False,
         # store as *_planned, consistent with table naming
@@ -77,29 +83,72 @@ def get_preset(flask_id: int, db: Session = Depends(get_db)):
     }
 
 
-@router.post("")
-async def post_prep(payload: MetalPrepPost, db: Session = Depends(get_db)):
+def _prep_upsert(rows: list[dict]):
+    """INSERT ... ON CONFLICT (flask_id) DO UPDATE for one or many MetalPrep rows."""
+    stmt = pg_insert(models.MetalPrep).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.MetalPrep.flask_id],
+        set_={
+            "prepared": stmt.excluded.prepared,
+            "scrap_planned": stmt.excluded.scrap_planned,
+            "fine_24k_planned": stmt.excluded.fine_24k_planned,
+            "alloy_planned": stmt.excluded.alloy_planned,
+            "pure_planned": stmt.excluded.pure_planned,
+            "posted_at": stmt.excluded.posted_at,
+            "posted_by": stmt.excluded.posted_by,
+        },
+    )
+
+
+def _prep_fingerprint(prepared, scrap, fine, alloy, pure, posted_by):
+    """Comparable identity of a prep post (amounts at the columns' 3 decimals)."""
+    return (bool(prepared), *(round(float(v or 0.0), 3) for v in (scrap, fine, alloy, pure)), posted_by)
+
+
+def _prep_context():
+    """flask + metal + waxing + current prep + scrap reserve, one row per flask."""
+    return (
+        select(models.Flask, models.Metal, models.WaxingEntry, models.MetalPrep, models.ScrapReserve)
+        .outerjoin(models.Metal, models.Metal.id == models.Flask.metal_id)
+        .outerjoin(models.WaxingEntry, models.WaxingEntry.flask_id == models.Flask.id)
+        .outerjoin(models.MetalPrep, models.MetalPrep.flask_id == models.Flask.id)
+        .outerjoin(models.ScrapReserve, models.ScrapReserve.metal_id == models.Flask.metal_id)
+    )
+
+
+async def _stage_prep(db: AsyncSession, payload: MetalPrepPost, now: datetime, row=_MISSING):
     """
-    Create/update MetalPrep row; move flask to SUPPLY.
-    If prepared=True, enforce validations:
-      - total within ±5% of required
-      - ratio for gold on (required - scrap)
-      - scrap availability in reserve
-    If prepared=False, skip validations.
+    Validate one prep post and apply its reserve hold/release and stage change
+    to the session. Returns (MetalPrep row values, ScrapMovement row or None);
+    the caller writes those rows and commits. A repeat of the post that already
+    moved this flask to SUPPLY returns (None, None): nothing to write.
+    `row` is the flask's _prep_context() row (None = not found) when the caller
+    has already loaded it; otherwise it is fetched here.
     """
-    flask = db.get(models.Flask, payload.flask_id)
-    if not flask:
+    if row is _MISSING:
+        # lambda_stmt: the statement is built and cache-keyed once; flask_id binds per call
+        flask_id = payload.flask_id
+        row = (await db.execute(lambda_stmt(
+            lambda: _prep_context().where(models.Flask.id == flask_id)
+        ))).first()
+    if not row:
         raise HTTPException(404, detail="Flask not found")
+    flask, metal, waxing, existing, reserve = row
+
+    # idempotent re-post (double submit / client retry): same values, already applied
+    if flask.status == models.Stage.supply and existing is not None and _prep_fingerprint(
+        existing.prepared, existing.scrap_planned, existing.fine_24k_planned,
+        existing.alloy_planned, existing.pure_planned, existing.posted_by,
+    ) == _prep_fingerprint(
+        payload.prepared, payload.scrap_planned, payload.fine_24k_planned,
+        payload.alloy_planned, payload.pure_planned, payload.posted_by,
+    ):
+        return None, None
 
     # must be in metal_prep stage to post from here
     if flask.status != models.Stage.metal_prep:
         raise HTTPException(400, detail=f"Flask is not in metal_prep (currently {flask.status}).")
 
-    metal = db.get(models.Metal, flask.metal_id)
-
-    waxing = db.execute(
-        select(models.WaxingEntry).where(models.WaxingEntry.flask_id == flask.id)
-    ).scalar_one_or_none()
     required = float(waxing.metal_weight) if waxing else 0.0
 
     # Only validate when actually preparing
@@ -112,9 +161,6 @@ async def post_prep(payload: MetalPrepPost, db: Session = Depends(get_db)):
         pure  = float(payload.pure_planned or 0.0)
 
         # scrap availability
-        reserve = db.query(models.ScrapReserve).filter(
-            models.ScrapReserve.metal_id == flask.metal_id
-        ).first()
         available_scrap = float(reserve.qty_on_hand or 0.0) if reserve else 0.0
         if scrap > 0 and scrap > available_scrap:
             raise HTTPException(
@@ -158,13 +204,6 @@ async def post_prep(payload: MetalPrepPost, db: Session = Depends(get_db)):
                     ),
                 )
 
-    # upsert MetalPrep row (do not touch reserves here)
-    existing = db.execute(
-        select(models.MetalPrep).where(models.MetalPrep.flask_id == flask.id)
-    ).scalar_one_or_none()
-
-    now = datetime.utcnow()
-    
     # -------- NEW: delta-based reserve hold/release when prepared=True --------
     # previous reservation:
     prev_prepared = bool(existing.prepared) if existing else False
@@ -177,68 +216,143 @@ async def post_prep(payload: MetalPrepPost, db: Session = Depends(get_db)):
     prev_effective = prev_reserved if prev_prepared else 0.0
     delta_hold = target_reserved - prev_effective  # +ve = take from reserve, -ve = release
 
-    # find reserve row for this metal
-    reserve = db.query(models.ScrapReserve)\
-                .filter(models.ScrapReserve.metal_id == flask.metal_id)\
-                .first()
+    # when actually changing a reservation:
+    movement = None
+    if abs(delta_hold) > 1e-9:
+        # guarded hold/release: the availability check and the write are one
+        # statement, so two concurrent posts can't both pass a stale read
+        sr = models.ScrapReserve
+        on_hand = func.coalesce(sr.qty_on_hand, 0)
+        upd = update(sr).where(sr.metal_id == flask.metal_id)
+        if delta_hold > 0:
+            upd = upd.where(on_hand >= delta_hold)
+        upd = upd.values(qty_on_hand=on_hand - delta_hold).returning(sr.qty_on_hand)
+        new_qty = (await db.execute(upd.execution_options(synchronize_session=False))).scalar()
+        if new_qty is None:
+            if delta_hold > 0:
+                detail = ("No scrap reserve for this metal." if reserve is None
+                          else "Not enough scrap in reserve for preparation hold.")
+                raise HTTPException(400, detail=detail)
+            # releasing to a non-existing row shouldn't happen; create it holding the release
+            reserve = models.ScrapReserve(metal_id=flask.metal_id, qty_on_hand=-delta_hold)
+            db.add(reserve)
+            await db.flush()
+        elif reserve is not None:
+            # keep the loaded row in step (later items of a bulk post read it), without a flush
+            set_committed_value(reserve, "qty_on_hand", new_qty)
+        movement = dict(
+            metal_id=flask.metal_id,
+            flask_id=flask.id,
+            delta=-delta_hold,  # negative means we took from reserve
+            source="prep.hold" if delta_hold > 0 else "prep.release",
+            created_by=payload.posted_by,
+        )
+
+    # advance to SUPPLY
+    flask.status = models.Stage.supply
+    flask.updated_at = now
+
+    prep = dict(
+        flask_id=flask.id,
+        prepared=new_prepared,
+        scrap_planned=new_reserved,
+        fine_24k_planned=float(payload.fine_24k_planned or 0.0),
+        alloy_planned=float(payload.alloy_planned or 0.0),
+        pure_planned=float(payload.pure_planned or 0.0),
+        posted_at=now,
+        posted_by=payload.posted_by,
+    )
+    return prep, movement
+
+
+async def _write_preps(db: AsyncSession, preps: list[dict], movements: list[dict]):
+    # one multi-row statement per table, however many flasks were posted
+    if movements:
+        await db.execute(insert(models.ScrapMovement), movements)
+    await db.execute(_prep_upsert(preps))
+
 
+@router.post("")
+async def post_prep(payload: MetalPrepPost, db: AsyncSession = Depends(get_async_db)):
+    """
+    Create/update MetalPrep row; move flask to SUPPLY.
+    If prepared=True, enforce validations:
+      - total within ±5% of required
+      - ratio for gold on (required - scrap)
+      - scrap availability in reserve
+    If prepared=False, skip validations.
+    """
+    now = models.utcnow()
     try:
-        # when actually changing a reservation:
-        if abs(delta_hold) > 1e-9:
-            if reserve is None:
-                if delta_hold > 0:
-                    raise HTTPException(400, detail="No scrap reserve for this metal.")
-                # releasing to a non-existing row shouldn't happen; create if you prefer
-                reserve = models.ScrapReserve(metal_id=flask.metal_id, qty_on_hand=0.0)
-                db.add(reserve)
-                db.flush()
-
-            if delta_hold > 0 and float(reserve.qty_on_hand or 0.0) < delta_hold:
-                raise HTTPException(400, detail="Not enough scrap in reserve for preparation hold.")
-
-            # apply hold/release
-            reserve.qty_on_hand = float(reserve.qty_on_hand or 0.0) - delta_hold
-            db.add(models.ScrapMovement(
-                metal_id=flask.metal_id,
-                flask_id=flask.id,
-                delta=-delta_hold,  # negative means we took from reserve
-                source="prep.hold" if delta_hold > 0 else "prep.release",
-                created_by=payload.posted_by,
-            ))
-
-        # upsert MetalPrep
-        if existing:
-            existing.prepared = new_prepared
-            existing.scrap_planned = new_reserved
-            existing.fine_24k_planned = float(payload.fine_24k_planned or 0.0)
-            existing.alloy_planned = float(payload.alloy_planned or 0.0)
-            existing.pure_planned = float(payload.pure_planned or 0.0)
-            existing.posted_at = now
-            existing.posted_by = payload.posted_by
-        else:
-            db.add(models.MetalPrep(
-                flask_id=flask.id,
-                prepared=new_prepared,
-                scrap_planned=new_reserved,
-                fine_24k_planned=float(payload.fine_24k_planned or 0.0),
-                alloy_planned=float(payload.alloy_planned or 0.0),
-                pure_planned=float(payload.pure_planned or 0.0),
-                posted_at=now,
-                posted_by=payload.posted_by,
-            ))
-
-        # advance to SUPPLY
-        flask.status = models.Stage.supply
-        flask.updated_at = now
-
-        db.commit()
-    except HTTPException:
-        db.rollback()
+        prep, movement = await _stage_prep(db, payload, now)
+        if prep is None:  # replay of the post that already went through
+            return {"flask_id": payload.flask_id, "moved_to": models.Stage.supply.value, "prepared": payload.prepared}
+        await _write_preps(db, [prep], [movement] if movement else [])
+        await db.commit()
+    except Exception:
+        await db.rollback()
         raise
+    cache.scrap_reserves.clear()
+    cache.supply_queue.clear()
+
+    manager.broadcast_nowait({"event": "metal_prep_posted", "flask_id": prep["flask_id"]})
+
+    return {"flask_id": prep["flask_id"], "moved_to": models.Stage.supply.value, "prepared": prep["prepared"]}
+
+
+@router.post("/bulk")
+async def post_prep_bulk(payload: list[MetalPrepPost], db: AsyncSession = Depends(get_async_db)):
+    """
+    Same as POST /metal-prep for many flasks in one transaction (all or nothing).
+    Reserve holds accumulate across items, so two flasks of the same metal can't
+    both claim the same scrap. MetalPrep and ScrapMovement rows are written with
+    one multi-row statement each.
+    """
+    if not payload:
+        raise HTTPException(422, detail="No flasks to post.")
+
+    # one item per flask: an exact repeat (double submit) collapses into the
+    # first, a repeat with different values is ambiguous and rejected
+    items: dict[int, MetalPrepPost] = {}
+    for item in payload:
+        seen = items.setdefault(item.flask_id, item)
+        if seen is not item and seen.model_dump() != item.model_dump():
+            raise HTTPException(422, detail=f"Flask {item.flask_id} appears more than once with different values.")
+    payload = list(items.values())
+
+    now = models.utcnow()
+    preps, movements = [], []
+    try:
+        # every item's context in one SELECT ... WHERE flasks.id IN (...)
+        flask_ids = list({item.flask_id for item in payload})
+        rows = (await db.execute(lambda_stmt(
+            lambda: _prep_context().where(models.Flask.id.in_(flask_ids))
+        ))).all()
+        by_id = {row[0].id: row for row in rows}
+        for item in payload:
+            try:
+                prep, movement = await _stage_prep(db, item, now, by_id.get(item.flask_id))
+            except HTTPException as e:
+                raise HTTPException(e.status_code, detail=f"Flask {item.flask_id}: {e.detail}")
+            if prep is None:
+                continue  # already applied with these values
+            preps.append(prep)
+            if movement:
+                movements.append(movement)
+        if preps:
+            await _write_preps(db, preps, movements)
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
+    if preps:
+        cache.scrap_reserves.clear()
+        cache.supply_queue.clear()
 
-    await manager.broadcast({"event": "metal_prep_posted", "flask_id": flask.id})
+    for prep in preps:
+        manager.broadcast_nowait({"event": "metal_prep_posted", "flask_id": prep["flask_id"]})
 
-    return {"flask_id": flask.id, "moved_to": models.Stage.supply.value, "prepared": new_prepared}
\ No newline at end of file
+    return {
+        "moved_to": models.Stage.supply.value,
+        "flasks": [{"flask_id": item.flask_id, "prepared": item.prepared} for item in payload],
+    }
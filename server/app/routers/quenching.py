@@ -1,36 +1,54 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 from datetime import datetime, timezone
-from ..db import get_db
+from ..db import get_async_db
 from .. import models
 from ..websockets import manager
 
 router = APIRouter(prefix="/quenching", tags=["quenching"])
 
 @router.post("/{flask_id}/post")
-async def post_quenching(flask_id: int, payload: dict, db: Session = Depends(get_db)):
-    flask = db.get(models.Flask, flask_id)
-    if not flask or flask.status != models.Stage.quenching:
-        raise HTTPException(400, "flask not in quenching stage")
+async def post_quenching(flask_id: int, payload: dict, db: AsyncSession = Depends(get_async_db)):
+    # Advance to cutting stage in one statement. The WHERE is a compare-and-set:
+    # only a flask still in quenching *with* a quenching record moves, so two
+    # concurrent posts (or the auto sweep) can't both succeed.
+    now = models.utcnow()
+    q_ready_at = (
+        select(models.Quenching.ready_at)
+        .where(models.Quenching.flask_id == models.Flask.id)
+        .scalar_subquery()
+    )
+    ready_at = (await db.execute(
+        update(models.Flask)
+        .where(
+            models.Flask.id == flask_id,
+            models.Flask.status == models.Stage.quenching,
+            q_ready_at.is_not(None),
+        )
+        .values(status=models.Stage.cutting, updated_at=now)
+        .returning(q_ready_at)
+    )).scalar_one_or_none()
 
-    q = db.execute(select(models.Quenching).where(models.Quenching.flask_id == flask.id)).scalar_one_or_none()
-    if not q:
+    if ready_at is None:
+        await db.rollback()
+        # failure path only: work out which precondition failed
+        status = (await db.execute(
+            select(models.Flask.status).where(models.Flask.id == flask_id)
+        )).scalar_one_or_none()
+        if status != models.Stage.quenching:
+            raise HTTPException(400, "flask not in quenching stage")
         raise HTTPException(400, "quenching record missing (did casting complete?)")
 
     # Optional guard: ensure it's ready (time reached). Comment out if not needed.
-    # if datetime.now(timezone.utc) < q.ready_at.replace(tzinfo=timezone.utc):
+    # if datetime.now(timezone.utc) < ready_at.replace(tzinfo=timezone.utc):
     #     raise HTTPException(400, "not ready yet")
 
-    # Advance to cutting stage
-    now = datetime.utcnow()
-    flask.status = models.Stage.cutting
-    flask.updated_at = now
-    db.commit()
+    await db.commit()
 
-    await manager.broadcast({"event": "quenching_posted", "flask_id": flask.id})
+    manager.broadcast_nowait({"event": "quenching_posted", "flask_id": flask_id})
     return {
-        "flask_id": flask.id,
-        "ready_at": q.ready_at.isoformat(),
+        "flask_id": flask_id,
+        "ready_at": ready_at.isoformat(),
         "moved_to": "cutting"
     }
@@ -1,11 +1,14 @@
 # server/app/routers/queue.py
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from datetime import datetime, timezone, date
+from sqlalchemy import func, select
+from datetime import date
+import orjson
 
-from ..db import get_db
+from ..db import SessionLocal, get_db, pg_json_array
 from .. import models
+from ..responses import json_response
 
 router = APIRouter(prefix="/queue", tags=["queue"])
 
@@ -48,21 +51,22 @@ def transit_queue(
     q = q.order_by(t.date.desc(), m.name.asc(), t.tree_no.asc())
     rows = db.execute(q).all()
 
-    return [
+    return json_response([
         {
-            "tree_id": r.tree_id,
-            "date": r.date.isoformat(),
-            "tree_no": r.tree_no,
-            "metal_name": r.metal_name,
+            "tree_id": tree_id,
+            "date": tdate,
+            "tree_no": tree_no,
+            "metal_name": metal_name,
             # NEW: surface to UI for autofill (may be None)
-            "gasket_weight": float(r.gasket_weight) if r.gasket_weight is not None else None,
-            "total_weight":  float(r.total_weight)  if r.total_weight  is not None else None,
+            "gasket_weight": float(gasket_weight) if gasket_weight is not None else None,
+            "total_weight":  float(total_weight)  if total_weight  is not None else None,
             # existing
-            "tree_weight": float(r.tree_weight),
-            "est_metal_weight": float(r.est_metal_weight),
+            "tree_weight": float(tree_weight),
+            "est_metal_weight": float(est_metal_weight),
         }
-        for r in rows
-    ]
+        for (tree_id, tdate, tree_no, gasket_weight, total_weight,
+             tree_weight, est_metal_weight, metal_name) in rows
+    ])
 
 @router.get("/metal_prep")
 def metal_prep_queue(
@@ -104,14 +108,14 @@ def metal_prep_queue(
         stmt = stmt.where((f.flask_no.ilike(like)) | (t.tree_no.ilike(like)))
 
     rows = db.execute(stmt).all()
-    return [{
-        "flask_id": r.flask_id,                         # ⬅ returned to UI
-        "date": r.date.isoformat() if r.date else None,
-        "flask_no": r.flask_no,
-        "tree_no": r.tree_no,                           # ⬅ returned to UI
-        "metal_name": r.metal_name,
-        "required_metal_weight": float(r.required_metal_weight or 0.0),
-    } for r in rows]
+    return json_response([{
+        "flask_id": flask_id,                           # ⬅ returned to UI
+        "date": fdate,
+        "flask_no": flask_no,
+        "tree_no": tree_no,                             # ⬅ returned to UI
+        "metal_name": metal_name,
+        "required_metal_weight": float(required_metal_weight or 0.0),
+    } for (flask_id, fdate, flask_no, tree_no, metal_name, required_metal_weight) in rows])
 
 @router.get("/reconciliation")
 def reconciliation_queue(
@@ -126,6 +130,9 @@ def reconciliation_queue(
     t = models.Tree
     r = models.Reconciliation
 
+    # weights are coalesced in SQL so the Postgres JSON path sends 0 where the
+    # Python path below would, not null
+    order = (f.date.desc(), m.name.asc(), f.flask_no.asc())
     stmt = (
         select(
             f.id.label("flask_id"),
@@ -133,17 +140,17 @@ def reconciliation_queue(
             f.flask_no,
             t.tree_no.label("tree_no"),
             m.name.label("metal_name"),
-            r.supplied_weight,
-            r.before_cut_weight,
-            r.after_cast_weight,
-            r.after_scrap_weight,
-            r.loss_total,
+            func.coalesce(r.supplied_weight, 0).label("supplied_weight"),
+            func.coalesce(r.before_cut_weight, 0).label("before_cut_weight"),
+            func.coalesce(r.after_cast_weight, 0).label("after_cast_weight"),
+            func.coalesce(r.after_scrap_weight, 0).label("after_scrap_weight"),
+            func.coalesce(r.loss_total, 0).label("loss_total"),
         )
         .join(m, m.id == f.metal_id)
         .outerjoin(t, t.id == f.tree_id)
         .join(r, r.flask_id == f.id)
         .where(f.status == models.Stage.reconciliation)
-        .order_by(f.date.desc(), m.name.asc(), f.flask_no.asc())
+        .order_by(*order)
     )
 
     if date_from:
@@ -156,22 +163,43 @@ def reconciliation_queue(
         like = f"%{q}%"
         stmt = stmt.where((f.flask_no.ilike(like)) | (t.tree_no.ilike(like)))
 
+    # Postgres builds the JSON array itself; the labels above are the keys
+    body = pg_json_array(db, stmt, order)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+
     rows = db.execute(stmt).all()
-    return [
+    return json_response([
         {
-            "flask_id": r.flask_id,
-            "date": r.date.isoformat() if r.date else None,
-            "flask_no": r.flask_no,
-            "tree_no": r.tree_no,
-            "metal_name": r.metal_name,
-            "supplied_weight": float(r.supplied_weight or 0.0),
-            "before_cut_weight": float(r.before_cut_weight or 0.0),
-            "after_cast_weight": float(r.after_cast_weight or 0.0),
-            "after_scrap_weight": float(r.after_scrap_weight or 0.0),
-            "loss_total": float(r.loss_total or 0.0),
+            "flask_id": flask_id,
+            "date": fdate,
+            "flask_no": flask_no,
+            "tree_no": tree_no,
+            "metal_name": metal_name,
+            "supplied_weight": float(supplied_weight or 0.0),
+            "before_cut_weight": float(before_cut_weight or 0.0),
+            "after_cast_weight": float(after_cast_weight or 0.0),
+            "after_scrap_weight": float(after_scrap_weight or 0.0),
+            "loss_total": float(loss_total or 0.0),
         }
-        for r in rows
-    ]
+        for (flask_id, fdate, flask_no, tree_no, metal_name, supplied_weight,
+             before_cut_weight, after_cast_weight, after_scrap_weight, loss_total) in rows
+    ])
+
+
+def _stream_json_array(stmt, to_items, batch: int = 500):
+    """
+    Yield a JSON array of to_items(rows), fetching `batch` rows at a time.
+    Uses its own session: the request's session is closed before the body is sent.
+    """
+    with SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=batch))
+        yield b"["
+        sep = b""
+        for part in result.partitions():
+            yield sep + b",".join(orjson.dumps(item) for item in to_items(part))
+            sep = b","
+        yield b"]"
 
 
 @router.get("/{stage}", name="List By Stage")
@@ -183,10 +211,36 @@ def list_by_stage(
     """List flasks by pipeline stage (waxing/supply/casting/quenching/cutting/done)."""
     f = models.Flask
     m = models.Metal
+    sp = models.Supply
+    w = models.WaxingEntry
+    t = models.Tree
+    qn = models.Quenching
 
+    # one statement for the whole page: supply / waxing / tree / quenching ride
+    # along as outer joins, and only the columns the page shows are selected so
+    # rows come back as plain tuples (no ORM identity-map hydration)
     stmt = (
-        select(f)
-        .join(m)
+        select(
+            f.id,
+            f.date,
+            f.flask_no,
+            f.metal_id,
+            m.name,
+            f.status,
+            t.tree_no,
+            sp.id,
+            sp.scrap_supplied,
+            sp.fine_24k_supplied,
+            sp.alloy_supplied,
+            w.metal_weight,
+            qn.quenching_time_min,
+            qn.ready_at,
+        )
+        .join(m, m.id == f.metal_id)
+        .outerjoin(sp, sp.flask_id == f.id)
+        .outerjoin(w, w.flask_id == f.id)
+        .outerjoin(t, t.id == f.tree_id)
+        .outerjoin(qn, qn.flask_id == f.id)
         .where(f.status == stage)
         .order_by(
             f.date.desc(),
@@ -198,68 +252,48 @@ def list_by_stage(
     if flask_no:
         stmt = stmt.where(f.flask_no.ilike(f"%{flask_no}%"))
 
-    flasks = db.execute(stmt.order_by(f.date.desc())).scalars().all()
-
-    result: list[dict] = []
-    for fl in flasks:
-        item = {
-            "id": fl.id,
-            "date": fl.date.isoformat(),
-            "flask_no": fl.flask_no,
-            "metal_id": fl.metal_id,
-            "metal_name": fl.metal.name if getattr(fl, "metal", None) else None,
-            "status": fl.status.value,
-        }
-
-        supply_row = db.execute(
-            select(models.Supply).where(models.Supply.flask_id == fl.id)
-        ).scalar_one_or_none()
+    now = models.utcnow()  # quenching.ready_at is stored as naive UTC
 
-        # add Tree No for display / search
-        tno = db.execute(
-            select(models.Tree.tree_no).where(models.Tree.id == fl.tree_id)
-        ).scalar_one_or_none()
-        item["tree_no"] = tno
+    def items(rows):
+        for (fid, fdate, fno, metal_id, metal_name, status, tno,
+             supply_id, scrap_supplied, fine_supplied, alloy_supplied,
+             wax_metal_weight, quench_min, ready_at) in rows:
+            item = {
+                "id": fid,
+                "date": fdate,
+                "flask_no": fno,
+                "metal_id": metal_id,
+                "metal_name": metal_name,
+                "status": status.value,
+            }
 
+            # add Tree No for display / search
+            item["tree_no"] = tno
 
-        if stage in (
-            models.Stage.casting,
-            models.Stage.quenching,
-            models.Stage.cutting,
-            models.Stage.done,
-        ) and supply_row:
-            total_supplied = (
-                float(supply_row.scrap_supplied or 0)
-                + float(getattr(supply_row, "fine_24k_supplied", 0) or 0)
-                + float(getattr(supply_row, "alloy_supplied", 0) or 0)
-            )
-            item["metal_weight"] = round(total_supplied, 3)
-        else:
-            waxing_row = db.execute(
-                select(models.WaxingEntry).where(models.WaxingEntry.flask_id == fl.id)
-            ).scalar_one_or_none()
-            if waxing_row:
-                item["metal_weight"] = float(waxing_row.metal_weight)
 
-        if stage == models.Stage.quenching:
-            try:
-                qrec = db.execute(
-                    select(models.Quenching).where(models.Quenching.flask_id == fl.id)
-                ).scalar_one_or_none()
-                if qrec:
-                    item["quenching_time_min"] = qrec.quenching_time_min
-                    item["ready_at"] = qrec.ready_at.isoformat()
-                    from datetime import timezone as _tz, datetime as _dt
-                    now = _dt.now(_tz.utc)
-                    ready = qrec.ready_at
-                    if ready.tzinfo is None:
-                        ready = ready.replace(tzinfo=_tz.utc)
-                    mins_left = int(max(0, (ready - now).total_seconds() // 60))
-                    item["minutes_left"] = mins_left
-            except Exception:
-                pass
+            if stage in (
+                models.Stage.casting,
+                models.Stage.quenching,
+                models.Stage.cutting,
+                models.Stage.done,
+            ) and supply_id is not None:
+                total_supplied = (
+                    float(scrap_supplied or 0)
+                    + float(fine_supplied or 0)
+                    + float(alloy_supplied or 0)
+                )
+                item["metal_weight"] = round(total_supplied, 3)
+            elif wax_metal_weight is not None:
+                item["metal_weight"] = float(wax_metal_weight)
 
-        result.append(item)
+            if stage == models.Stage.quenching and ready_at is not None:
+                item["quenching_time_min"] = quench_min
+                item["ready_at"] = ready_at
+                item["minutes_left"] = max(0, int((ready_at - now).total_seconds()) // 60)
 
-    return result
+            yield item
 
+    if stage == models.Stage.done:
+        # finished flasks only accumulate: stream them instead of building the list
+        return StreamingResponse(_stream_json_array(stmt, items), media_type="application/json")
+    return json_response(list(items(db.execute(stmt))))
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select
-from datetime import datetime
-from decimal import Decimal
+from sqlalchemy.orm import Session, raiseload
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from ..db import get_db
-from .. import models, schemas
+from .. import cache, models, schemas
+from ..responses import json_response
 from ..websockets import manager
 
 router = APIRouter(prefix="/reconciliation", tags=["reconciliation"])
@@ -14,27 +14,28 @@ router = APIRouter(prefix="/reconciliation", tags=["reconciliation"])
 @router.get("/{flask_id}")
 def get_recon(flask_id: int, db: Session = Depends(get_db)):
     """Fetch staged reconciliation values plus context."""
-    flask = db.get(models.Flask, flask_id)
-    if not flask:
+    # flask + staged values + metal name + tree no in one round-trip
+    f = models.Flask
+    r = models.Reconciliation
+    row = db.execute(
+        select(f, r, models.Metal.name, models.Tree.tree_no)
+        .outerjoin(r, r.flask_id == f.id)
+        .outerjoin(models.Metal, models.Metal.id == f.metal_id)
+        .outerjoin(models.Tree, models.Tree.id == f.tree_id)
+        .where(f.id == flask_id)
+        .options(raiseload("*"))
+    ).one_or_none()
+    if not row:
         raise HTTPException(404, "Flask not found")
+    flask, rec, metal_name, tree_no = row
 
-    rec = db.execute(
-        select(models.Reconciliation).where(models.Reconciliation.flask_id == flask.id)
-    ).scalar_one_or_none()
-
-    metal = db.get(models.Metal, flask.metal_id)
-    tree_no = None
-    if flask.tree_id:
-        tree = db.get(models.Tree, flask.tree_id)
-        tree_no = tree.tree_no if tree else None
-
-    return {
+    return json_response({
         "flask_id": flask.id,
-        "date": flask.date.isoformat() if flask.date else None,
+        "date": flask.date,
         "flask_no": flask.flask_no,
         "tree_no": tree_no,
         "metal_id": flask.metal_id,
-        "metal_name": metal.name if metal else None,
+        "metal_name": metal_name,
         "supplied_weight": float(getattr(rec, "supplied_weight", 0.0) or 0.0),
         "before_cut_weight": float(getattr(rec, "before_cut_weight", 0.0) or 0.0),
         "after_cast_weight": float(getattr(rec, "after_cast_weight", 0.0) or 0.0),
@@ -42,115 +43,102 @@ def get_recon(flask_id: int, db: Session = Depends(get_db)):
         "loss_part_i": float(getattr(rec, "loss_part_i", 0.0) or 0.0),
         "loss_part_ii": float(getattr(rec, "loss_part_ii", 0.0) or 0.0),
         "loss_total": float(getattr(rec, "loss_total", 0.0) or 0.0),
-    }
+    })
 
 
 @router.post("/confirm")
 async def confirm(payload: schemas.ReconciliationCreate, db: Session = Depends(get_db)):
     """
     Finalize reconciliation:
-      - recompute loss_i, loss_ii, loss_total
+      - store final weights (loss_i, loss_ii, loss_total are generated columns)
       - validations (non-negative; ≤5% of before-cut)
       - credit after_scrap to reserve
       - update Cutting row with final numbers
       - advance flask to 'done'
     """
-    flask = db.get(models.Flask, payload.flask_id)
+    flask = db.get(models.Flask, payload.flask_id, options=[raiseload("*")])
     if not flask or flask.status != models.Stage.reconciliation:
         raise HTTPException(400, "Flask not in reconciliation stage")
 
-    try:
-        supplied   = Decimal(str(payload.supplied_weight))
-        before     = Decimal(str(payload.before_cut_weight))
-        after_cast = Decimal(str(payload.after_cast_weight))
-        after_scrap= Decimal(str(payload.after_scrap_weight))
-    except Exception:
-        raise HTTPException(400, "Invalid numeric values")
+    # plain floats: a 5% tolerance doesn't need Decimal precision
+    supplied = float(payload.supplied_weight)
+    before = float(payload.before_cut_weight)
+    after_cast = float(payload.after_cast_weight)
+    after_scrap = float(payload.after_scrap_weight)
 
     if before < 0 or after_cast < 0 or after_scrap < 0 or supplied < 0:
         raise HTTPException(400, "Weights must be >= 0")
 
-    loss_i   = supplied - before
-    loss_ii  = before - (after_cast + after_scrap)
-    loss_tot = supplied - after_cast - after_scrap
-
     # ---- Validations: same logic as cutting (tolerance 5%) ----
-    tol = Decimal("0.05")
-
     # Rule A: before must be within ±5% of supplied
-    if supplied > 0:
-        if (before - supplied).copy_abs() > (supplied * tol):
-            raise HTTPException(
-                400,
-                f"Before-cut ({before}) must be within 5% of supplied ({supplied}).",
-            )
+    if supplied > 0 and abs(before - supplied) > supplied * 0.05:
+        raise HTTPException(
+            400,
+            f"Before-cut ({payload.before_cut_weight}) must be within 5% of supplied ({payload.supplied_weight}).",
+        )
 
     # Rule B: (after_cast + after_scrap) must be within ±5% of before
-    total_after = after_cast + after_scrap
-    if before > 0:
-        if (total_after - before).copy_abs() > (before * tol):
-            raise HTTPException(
-                400,
-                "(After Cast + After Scrap) must be within 5% of Before-cut."
-            )
-        
-    now = datetime.utcnow()
+    if before > 0 and abs((after_cast + after_scrap) - before) > before * 0.05:
+        raise HTTPException(
+            400,
+            "(After Cast + After Scrap) must be within 5% of Before-cut."
+        )
+
+    now = models.utcnow()
     try:
-        # Upsert reconciliation with final numbers
-        rec = db.execute(
-            select(models.Reconciliation).where(models.Reconciliation.flask_id == flask.id)
-        ).scalar_one_or_none()
-        if rec:
-            rec.supplied_weight = float(supplied)
-            rec.before_cut_weight = float(before)
-            rec.after_cast_weight = float(after_cast)
-            rec.after_scrap_weight = float(after_scrap)
-            rec.loss_part_i = float(loss_i)
-            rec.loss_part_ii = float(loss_ii)
-            rec.loss_total = float(loss_tot)
-            rec.posted_by = payload.posted_by
-            rec.updated_at = now
-        else:
-            db.add(models.Reconciliation(
-                flask_id=flask.id,
-                supplied_weight=float(supplied),
-                before_cut_weight=float(before),
-                after_cast_weight=float(after_cast),
-                after_scrap_weight=float(after_scrap),
-                loss_part_i=float(loss_i),
-                loss_part_ii=float(loss_ii),
-                loss_total=float(loss_tot),
-                posted_by=payload.posted_by,
-            ))
+        # Upsert reconciliation with final numbers; the loss columns are
+        # generated by the database and come back via RETURNING
+        recon_stmt = pg_insert(models.Reconciliation).values(
+            flask_id=flask.id,
+            supplied_weight=supplied,
+            before_cut_weight=before,
+            after_cast_weight=after_cast,
+            after_scrap_weight=after_scrap,
+            posted_by=payload.posted_by,
+        )
+        loss_tot = db.execute(
+            recon_stmt.on_conflict_do_update(
+                index_elements=[models.Reconciliation.flask_id],
+                set_={
+                    "supplied_weight": recon_stmt.excluded.supplied_weight,
+                    "before_cut_weight": recon_stmt.excluded.before_cut_weight,
+                    "after_cast_weight": recon_stmt.excluded.after_cast_weight,
+                    "after_scrap_weight": recon_stmt.excluded.after_scrap_weight,
+                    "posted_by": recon_stmt.excluded.posted_by,
+                    "updated_at": now,   # onupdate= is not applied to ON CONFLICT updates
+                },
+            ).returning(models.Reconciliation.loss_total)
+        ).scalar_one()
 
         # Update Cutting row with the final figures (keeps existing reports compatible)
         cut = db.execute(
             select(models.Cutting).where(models.Cutting.flask_id == flask.id)
         ).scalar_one_or_none()
         if cut:
-            cut.before_cut_A = float(before)
-            cut.after_casting_C = float(after_cast)
-            cut.after_scrap_B = float(after_scrap)
+            cut.before_cut_A = before
+            cut.after_casting_C = after_cast
+            cut.after_scrap_B = after_scrap
             cut.loss = float(loss_tot)
             cut.posted_at = now
             cut.posted_by = payload.posted_by
 
-        # Credit scrap to reserve (only now)
-        reserve = db.query(models.ScrapReserve).filter(
-            models.ScrapReserve.metal_id == flask.metal_id
-        ).first()
-        if not reserve:
-            db.add(models.ScrapReserve(
-                metal_id=flask.metal_id, qty_on_hand=float(after_scrap)
-            ))
-        else:
-            reserve.qty_on_hand = float(reserve.qty_on_hand or 0.0) + float(after_scrap)
+        # Credit scrap to reserve (only now): one atomic upsert, no read first
+        reserve_stmt = pg_insert(models.ScrapReserve).values(
+            metal_id=flask.metal_id, qty_on_hand=after_scrap
+        )
+        db.execute(reserve_stmt.on_conflict_do_update(
+            index_elements=[models.ScrapReserve.metal_id],
+            set_={
+                "qty_on_hand": func.coalesce(models.ScrapReserve.qty_on_hand, 0)
+                + reserve_stmt.excluded.qty_on_hand,
+            },
+        ))
 
         # Log movement (optional but consistent with your usage elsewhere)
-        db.add(models.ScrapMovement(
+        db.execute(insert(models.ScrapMovement).values(
             metal_id=flask.metal_id,
             flask_id=flask.id,
-            delta=float(after_scrap),
+            delta=after_scrap,
             source="reconciliation.add",
             created_by=payload.posted_by,
         ))
@@ -163,11 +151,13 @@ async def confirm(payload: schemas.ReconciliationCreate, db: Session = Depends(g
     except Exception:
         db.rollback()
         raise
+    cache.scrap_loss_summary.clear()
+    cache.scrap_reserves.clear()
 
-    await manager.broadcast({"event": "reconciliation_confirmed", "flask_id": flask.id})
+    manager.broadcast_nowait({"event": "reconciliation_confirmed", "flask_id": flask.id})
     return {
         "flask_id": flask.id,
         "moved_to": "done",
         "loss_total": float(loss_tot),
-        "scrap_added": float(after_scrap),
+        "scrap_added": after_scrap,
     }
@@ -1,17 +1,19 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
 from datetime import date
 from typing import Optional
 
-from ..db import get_db
-from .. import models
+from ..db import get_db, pg_json_array
+from .. import cache, models
+from ..responses import json_response
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 
 @router.get("/transit")
 def transit_summary(
+    request: Request,
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
     metal: Optional[str] = Query(None),  # exact metal name; pass 'All' or omit for everything
@@ -25,6 +27,21 @@ def transit_summary(
       - date_from / date_to (inclusive)
       - metal (exact name); use 'All' or omit for all metals
     """
+    key = (date_from, date_to, metal)
+    gen = cache.transit_summary.generation
+    snap = cache.transit_summary.get(key)
+    if snap is None:
+        snap = cache.json_snapshot(_transit_summary(db, date_from, date_to, metal))
+        cache.transit_summary.set(key, snap, gen)
+
+    # the ETag hashes the served body, so it moves whenever the data does
+    etag, body = snap
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+def _transit_summary(db: Session, date_from: Optional[date], date_to: Optional[date], metal: Optional[str]) -> dict:
     t = models.Tree
     m = models.Metal
 
@@ -51,23 +68,24 @@ def transit_summary(
 
     data = [
         {
-            "metal_name": r.metal_name,
-            "count": int(r.count or 0),
-            "total_est_metal_weight": float(r.total_est or 0.0),
+            "metal_name": metal_name,
+            "count": int(count or 0),
+            "total_est_metal_weight": float(total_est or 0.0),
         }
-        for r in rows
+        for (metal_name, count, total_est) in rows
     ]
     overall_total = round(sum(d["total_est_metal_weight"] for d in data), 3)
 
-    return {
+    out = {
         "filters": {
-            "date_from": date_from.isoformat() if date_from else None,
-            "date_to": date_to.isoformat() if date_to else None,
+            "date_from": date_from,
+            "date_to": date_to,
             "metal": metal or "All",
         },
         "rows": data,
         "overall_total": overall_total,
     }
+    return out
 
 @router.get("/transit/trees")
 def transit_trees(
@@ -94,26 +112,29 @@ def transit_trees(
         q = q.where(t.date <= date_to)
 
     rows = db.execute(q).all()
-    return [{
-        "tree_id": r.tree_id,
-        "date": r.date.isoformat(),
-        "tree_no": r.tree_no,
-        "metal_name": r.metal_name,
-        "tree_weight": float(r.tree_weight) if r.tree_weight is not None else None,
-        "est_metal_weight": float(r.est_metal_weight) if r.est_metal_weight is not None else None,
-    } for r in rows]
+    return json_response([{
+        "tree_id": tree_id,
+        "date": tdate,
+        "tree_no": tree_no,
+        "metal_name": metal_name,
+        "tree_weight": float(tree_weight) if tree_weight is not None else None,
+        "est_metal_weight": float(est_metal_weight) if est_metal_weight is not None else None,
+    } for (tree_id, tdate, tree_no, tree_weight, est_metal_weight, metal_name) in rows])
 
 @router.get("/scrap_loss")
 def scrap_loss(
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
     metal: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
 ):
     c = models.Cutting
     f = models.Flask
     m = models.Metal
 
+    order = (f.date.desc(), m.name.asc(), f.flask_no.asc())
     q = (
         select(
             c.id,
@@ -125,7 +146,7 @@ def scrap_loss(
         .join(f, f.id == c.flask_id)
         .join(m, m.id == f.metal_id)
         .where(f.status == models.Stage.done)                      # <-- only confirmed (Recon -> Done)
-        .order_by(f.date.desc(), m.name.asc(), f.flask_no.asc())
+        .order_by(*order)
     )
     if date_from:
         q = q.where(f.date >= date_from)
@@ -133,18 +154,98 @@ def scrap_loss(
         q = q.where(f.date <= date_to)
     if metal and metal != "All":
         q = q.where(m.name == metal)
+    if limit is not None:
+        q = q.limit(limit)
+    if offset:
+        q = q.offset(offset)
+
+    # Postgres builds the JSON array itself; the column labels are the keys
+    body = pg_json_array(db, q, order)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
 
     rows = db.execute(q).all()
     out = []
-    for r in rows:
+    for (cid, fdate, flask_no, metal_name,
+         before_cut_A, after_casting_C, after_scrap_B, loss) in rows:
         out.append({
-            "id": r.id,
-            "date": r.date.isoformat() if r.date else None,
-            "flask_no": r.flask_no,
-            "metal_name": r.metal_name,
-            "before_cut_A": float(r.before_cut_A) if r.before_cut_A is not None else 0.0,
-            "after_casting_C": float(r.after_casting_C) if r.after_casting_C is not None else 0.0,
-            "after_scrap_B": float(r.after_scrap_B) if r.after_scrap_B is not None else 0.0,
-            "loss": float(r.loss) if r.loss is not None else 0.0,
+            "id": cid,
+            "date": fdate,
+            "flask_no": flask_no,
+            "metal_name": metal_name,
+            # NOT NULL, asdecimal=False: already floats
+            "before_cut_A": before_cut_A,
+            "after_casting_C": after_casting_C,
+            "after_scrap_B": after_scrap_B,
+            "loss": loss,
         })
-    return out
+    return json_response(out)
+
+
+@router.get("/scrap_loss/summary")
+def scrap_loss_summary(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    metal: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Totals of /scrap_loss grouped by metal name, summed in SQL so only one
+    row per metal comes back. Same filters as the detail endpoint.
+    """
+    key = (date_from, date_to, metal)
+    gen = cache.scrap_loss_summary.generation
+    cached = cache.scrap_loss_summary.get(key)
+    if cached is not None:
+        return json_response(cached)
+
+    c = models.Cutting
+    f = models.Flask
+    m = models.Metal
+
+    q = (
+        select(
+            m.name.label("metal_name"),
+            func.count(c.id).label("count"),
+            func.coalesce(func.sum(c.before_cut_A), 0).label("before_cut_A"),
+            func.coalesce(func.sum(c.after_casting_C), 0).label("after_casting_C"),
+            func.coalesce(func.sum(c.after_scrap_B), 0).label("after_scrap_B"),
+            func.coalesce(func.sum(c.loss), 0).label("loss"),
+        )
+        .join(f, f.id == c.flask_id)
+        .join(m, m.id == f.metal_id)
+        .where(f.status == models.Stage.done)
+        .group_by(m.name)
+        .order_by(m.name.asc())
+    )
+    if date_from:
+        q = q.where(f.date >= date_from)
+    if date_to:
+        q = q.where(f.date <= date_to)
+    if metal and metal != "All":
+        q = q.where(m.name == metal)
+
+    rows = db.execute(q).all()
+    data = [
+        {
+            "metal_name": metal_name,
+            "count": int(count or 0),
+            "before_cut_A": round(float(before_cut_A), 3),
+            "after_casting_C": round(float(after_casting_C), 3),
+            "after_scrap_B": round(float(after_scrap_B), 3),
+            "loss": round(float(loss), 3),
+        }
+        for (metal_name, count, before_cut_A, after_casting_C, after_scrap_B, loss) in rows
+    ]
+
+    out = {
+        "filters": {
+            "date_from": date_from,
+            "date_to": date_to,
+            "metal": metal or "All",
+        },
+        "rows": data,
+        "overall_loss": round(sum(d["loss"] for d in data), 3),
+    }
+    cache.scrap_loss_summary.set(key, out, gen)
+    return json_response(out)
@@ -1,18 +1,32 @@
 # routers/scrap.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from typing import Literal
 
 from ..db import get_db
-from .. import models
+from .. import cache, models
 
 router = APIRouter(prefix="/scrap", tags=["Scrap"])
 
 @router.get("/reserves")
-def get_scrap_reserves(db: Session = Depends(get_db)):
+def get_scrap_reserves(request: Request, db: Session = Depends(get_db)):
+    # snapshot lives 10s at most; reserve writes through the API clear it at once
+    gen = cache.scrap_reserves.generation
+    snap = cache.scrap_reserves.get("all")
+    if snap is None:
+        snap = cache.json_snapshot(_reserves_list(db))
+        cache.scrap_reserves.set("all", snap, gen)
+
+    # polling clients get a bodiless 304 while the served body is unchanged
+    etag, body = snap
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+def _reserves_list(db: Session) -> list[dict]:
     reserves = db.query(models.ScrapReserve).all()
-    return [
+    out = [
         {
             "id": r.id,
             "metal_id": r.metal_id,
@@ -21,6 +35,7 @@ def get_scrap_reserves(db: Session = Depends(get_db)):
         }
         for r in reserves
     ]
+    return out
 
 # ----- NEW -----
 class ScrapAdjustIn(BaseModel):
@@ -51,6 +66,7 @@ def adjust_scrap(req: ScrapAdjustIn, db: Session = Depends(get_db)):
 
     reserve.qty_on_hand = new_total
     db.commit()
+    cache.scrap_reserves.clear()
     db.refresh(reserve)
 
     return {
@@ -1,54 +1,23 @@
 # server/app/routers/supply.py
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from datetime import datetime
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from ..db import get_db
-from .. import models, schemas
-
-# websockets manager is optional
-try:
-    from ..websockets import manager  # type: ignore
-except Exception:  # pragma: no cover
-    manager = None  # type: ignore
+from ..db import get_db, get_async_db
+from .. import cache, models, schemas
+from ..responses import json_response
+from ..websockets import manager
 
 router = APIRouter(prefix="/supply", tags=["supply"])
 
 
-# ------------------ helpers ------------------
-def metal_rule(metal_name: str):
-    """
-    Returns rule dict:
-      - {'type': 'pure_only'} for Platinum/Silver
-      - {'type': 'gold_ratio', 'fine': X, 'alloy': Y} for 10/14/18K
-      - {'type': 'none'} otherwise
-    """
-    m = (metal_name or "").strip().lower()
-    if not m:
-        return {"type": "none"}
-    if "platinum" in m or "silver" in m:
-        return {"type": "pure_only"}
-    if m.startswith("10"):
-        return {"type": "gold_pct", "pct": 0.417}
-    if m.startswith("14"):
-        return {"type": "gold_pct", "pct": 0.587}
-    if m.startswith("18"):
-        return {"type": "gold_pct", "pct": 0.752}
-    return {"type": "none"}
-
-
-def ratio_ok(fine: float, alloy: float, exp_fine: int, exp_alloy: int, tol_frac: float = 0.05) -> bool:
-    """Check that supplied fine:alloy is within ±5% (default) of the expected ratio."""
-    total = fine + alloy
-    if total <= 0:
-        return True
-    expected_fraction = exp_fine / (exp_fine + exp_alloy)
-    actual_fraction = fine / total
-    return abs(actual_fraction - expected_fraction) <= tol_frac * expected_fraction
+# ------------------ queue (Prepared / Not Prepared split) ------------------
+# never mutated; serialized as-is
+_EMPTY_PREP = {"scrap_planned": 0.0, "fine_24k_planned": 0.0, "alloy_planned": 0.0, "pure_planned": 0.0}
 
 
-# ------------------ queue (Prepared / Not Prepared split) ------------------
 @router.get("/queue")
 def supply_queue(
     db: Session = Depends(get_db),
@@ -62,6 +31,11 @@ def supply_queue(
 
     UI can split rows into Prepared vs Not Prepared and pre-fill inputs from 'prepped'.
     """
+    gen = cache.supply_queue.generation
+    cached = cache.supply_queue.get(q or "")
+    if cached is not None:
+        return json_response(cached)
+
     f = models.Flask
     m = models.Metal
     p = models.MetalPrep
@@ -93,28 +67,31 @@ def supply_queue(
 
     rows = db.execute(stmt).all()
 
-    out = []
-    for r in rows:
-        out.append({
-            "id": r.flask_id,
-            "date": r.date.isoformat() if r.date else None,
-            "flask_no": r.flask_no,
-            "metal_name": r.metal_name,
-            "tree_no": r.tree_no,
-            "prepared": bool(r.prepared) if r.prepared is not None else False,
-            "prepped": {
-                "scrap_planned": float(r.prep_scrap or 0.0),
-                "fine_24k_planned": float(r.prep_fine or 0.0),
-                "alloy_planned": float(r.prep_alloy or 0.0),
-                "pure_planned": float(r.prep_pure or 0.0),
+    out = [
+        {
+            "id": fid,
+            "date": d,
+            "flask_no": fno,
+            "metal_name": mname,
+            "tree_no": tno,
+            "prepared": bool(prepared),
+            # flasks without a MetalPrep row share one zeroed dict
+            "prepped": _EMPTY_PREP if ps is None and pf is None and pa is None and pp is None else {
+                "scrap_planned": float(ps or 0.0),
+                "fine_24k_planned": float(pf or 0.0),
+                "alloy_planned": float(pa or 0.0),
+                "pure_planned": float(pp or 0.0),
             },
-        })
-    return out
+        }
+        for fid, d, fno, mname, tno, prepared, ps, pf, pa, pp in rows
+    ]
+    cache.supply_queue.set(q or "", out, gen)
+    return json_response(out)
 
 
 # ------------------ post supply ------------------
 @router.post("")
-async def post_supply(payload: schemas.SupplyCreate, db: Session = Depends(get_db)):
+async def post_supply(payload: schemas.SupplyCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Supply metal to a flask in SUPPLY stage:
       - Validates composition rules:
@@ -126,121 +103,107 @@ async def post_supply(payload: schemas.SupplyCreate, db: Session = Depends(get_d
       - Records ScrapMovement
       - Moves flask to CASTING
     """
-    # 1) Load flask and ensure stage
-    flask = db.get(models.Flask, payload.flask_id)
+    # 1) flask + waxing + prep + scrap reserve + current supply in one round-trip
+    row = (await db.execute(
+        select(models.Flask, models.WaxingEntry, models.MetalPrep, models.ScrapReserve, models.Supply)
+        .outerjoin(models.WaxingEntry, models.WaxingEntry.flask_id == models.Flask.id)
+        .outerjoin(models.MetalPrep, models.MetalPrep.flask_id == models.Flask.id)
+        .outerjoin(models.ScrapReserve, models.ScrapReserve.metal_id == models.Flask.metal_id)
+        .outerjoin(models.Supply, models.Supply.flask_id == models.Flask.id)
+        .where(models.Flask.id == payload.flask_id)
+    )).first()
+    flask, waxing, prepped, reserve, existing = row if row else (None,) * 5
     if not flask or flask.status != models.Stage.supply:
         raise HTTPException(status_code=400, detail="flask not in supply stage")
 
-    # 2) Metal and required metal from WaxingEntry
-    metal = db.get(models.Metal, flask.metal_id)
-    metal_name = metal.name if metal else ""
-    waxing = db.execute(
-        select(models.WaxingEntry).where(models.WaxingEntry.flask_id == flask.id)
-    ).scalar_one_or_none()
+    # 2) Required metal from WaxingEntry
     if not waxing:
         raise HTTPException(status_code=400, detail="waxing entry missing for this flask")
     required = float(waxing.metal_weight or 0.0)
 
-    # server/app/routers/supply.py  (inside post_supply)
-
-    # ... you already loaded `flask`, ensured stage, loaded `metal_name` and `required`
     scrap = float(payload.scrap_supplied or 0.0)
     fine  = float(payload.fine_24k_supplied or 0.0)
     alloy = float(payload.alloy_supplied or 0.0)
 
-    # find any prepped values
-    prepped = db.execute(
-        select(models.MetalPrep).where(models.MetalPrep.flask_id == flask.id)
-    ).scalar_one_or_none()
+    # prepped values (only a prepared MetalPrep already holds scrap)
     prepped_scrap = float(prepped.scrap_planned or 0.0) if (prepped and prepped.prepared) else 0.0
 
-    # reserve row (already in your code)
-    reserve = db.execute(
-        select(models.ScrapReserve).where(models.ScrapReserve.metal_id == flask.metal_id)
-    ).scalar_one_or_none()
     if reserve is None:
         raise HTTPException(status_code=400, detail="scrap reserve record not found for this metal")
 
     # ... rules + ±5% total check (keep as-is)
 
-    existing = db.execute(
-        select(models.Supply).where(models.Supply.flask_id == flask.id)
-    ).scalar_one_or_none()
-
-    now = datetime.utcnow()
     fresh = round(fine + alloy, 3)
     total_supplied = round(scrap + fresh, 3)
 
 
+    # scrap taken from (> 0) or given back to (< 0) the reserve:
+    #   on CREATE only the remainder after prep, on UPDATE only the change vs previous
+    if existing is None:
+        delta_scrap = scrap - prepped_scrap
+        short_detail = "insufficient scrap reserve for supply delta"
+    else:
+        delta_scrap = scrap - float(existing.scrap_supplied or 0.0)
+        short_detail = "insufficient scrap reserve for update delta"
+
     try:
-        if existing is None:
-            # -------- NEW on CREATE: consume only the remainder after prep --------
-            delta_scrap = scrap - prepped_scrap
-            # if positive, we need extra from reserve; if negative, release the difference
-            if delta_scrap > 0 and float(reserve.qty_on_hand or 0.0) < delta_scrap:
-                raise HTTPException(status_code=400, detail="insufficient scrap reserve for supply delta")
-
-            db.add(models.Supply(
+        if abs(delta_scrap) > 1e-9:
+            # guarded decrement: the availability check and the write are one
+            # statement, so two concurrent supplies can't both pass a stale read
+            sr = models.ScrapReserve
+            on_hand = func.coalesce(sr.qty_on_hand, 0)
+            upd = update(sr).where(sr.metal_id == flask.metal_id)
+            if delta_scrap > 0:
+                upd = upd.where(on_hand >= delta_scrap)
+            upd = upd.values(qty_on_hand=on_hand - delta_scrap).returning(sr.qty_on_hand)
+            if (await db.execute(upd)).first() is None:
+                raise HTTPException(status_code=400, detail=short_detail)
+            # append-only audit row: Core insert, no unit-of-work
+            await db.execute(insert(models.ScrapMovement).values(
+                metal_id=flask.metal_id,
                 flask_id=flask.id,
-                required_metal_weight=required,
-                scrap_supplied=scrap,
-                fine_24k_supplied=fine,
-                alloy_supplied=alloy,
-                fresh_supplied=fresh,
-                posted_by=payload.posted_by,
+                delta=-delta_scrap,  # negative: consume; positive: release back
+                source="supply.consume_delta" if delta_scrap > 0 else "supply.release_delta",
+                created_by=payload.posted_by,
             ))
 
-            if abs(delta_scrap) > 1e-9:
-                reserve.qty_on_hand = float(reserve.qty_on_hand or 0.0) - delta_scrap
-                db.add(models.ScrapMovement(
-                    metal_id=flask.metal_id,
-                    flask_id=flask.id,
-                    delta=-delta_scrap,  # negative: consume; positive: release back
-                    source="supply.consume_delta" if delta_scrap > 0 else "supply.release_delta",
-                    created_by=payload.posted_by,
-                ))
-        else:
-            # -------- NEW on UPDATE: consume/release only the change vs previous --------
-            prev_scrap = float(existing.scrap_supplied or 0.0)
-            delta_scrap = scrap - prev_scrap
-            if delta_scrap > 0 and float(reserve.qty_on_hand or 0.0) < delta_scrap:
-                raise HTTPException(status_code=400, detail="insufficient scrap reserve for update delta")
-
-            existing.required_metal_weight = required
-            existing.scrap_supplied = scrap
-            existing.fine_24k_supplied = fine
-            existing.alloy_supplied = alloy
-            existing.fresh_supplied = fresh
-            existing.posted_by = payload.posted_by
-            existing.posted_at = now
-
-            if abs(delta_scrap) > 1e-9:
-                reserve.qty_on_hand = float(reserve.qty_on_hand or 0.0) - delta_scrap
-                db.add(models.ScrapMovement(
-                    metal_id=flask.metal_id,
-                    flask_id=flask.id,
-                    delta=-delta_scrap,
-                    source="supply.consume_delta" if delta_scrap > 0 else "supply.release_delta",
-                    created_by=payload.posted_by,
-                ))
+        # INSERT ... ON CONFLICT (flask_id) DO UPDATE: create or replace in one statement
+        supply_stmt = pg_insert(models.Supply).values(
+            flask_id=flask.id,
+            required_metal_weight=required,
+            scrap_supplied=scrap,
+            fine_24k_supplied=fine,
+            alloy_supplied=alloy,
+            fresh_supplied=fresh,
+            posted_by=payload.posted_by,
+        )
+        await db.execute(supply_stmt.on_conflict_do_update(
+            index_elements=[models.Supply.flask_id],
+            set_={
+                "required_metal_weight": supply_stmt.excluded.required_metal_weight,
+                "scrap_supplied": supply_stmt.excluded.scrap_supplied,
+                "fine_24k_supplied": supply_stmt.excluded.fine_24k_supplied,
+                "alloy_supplied": supply_stmt.excluded.alloy_supplied,
+                "fresh_supplied": supply_stmt.excluded.fresh_supplied,
+                "posted_at": supply_stmt.excluded.posted_at,
+                "posted_by": supply_stmt.excluded.posted_by,
+            },
+        ))
 
         # move to CASTING (as in your code)
-        flask.status = models.Stage.casting
-        flask.updated_at = now
-        db.commit()
+        flask.status = models.Stage.casting  # updated_at via onupdate
+        await db.commit()
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
+    cache.scrap_reserves.clear()
+    cache.supply_queue.clear()
 
-    # 9) Optional broadcast
-    if manager:
-        try:
-            await manager.broadcast({"event": "supply_posted", "flask_id": flask.id})
-        except Exception:
-            pass
+    # 9) notify UIs without holding the response for websocket clients
+    manager.broadcast_nowait({"event": "supply_posted", "flask_id": flask.id})
 
     return {
         "flask_id": flask.id,
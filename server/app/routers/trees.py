@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
+from sqlalchemy import select, exists, lambda_stmt, and_, func, cast, literal, BigInteger
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import date as dtdate
 import re
 
 from ..db import get_db
-from .. import models, schemas
+from .. import cache, models, schemas
 from ..formulas import est_metal_weight  # your existing helper
 
 router = APIRouter(prefix="/trees", tags=["trees"])
@@ -35,16 +36,17 @@ router = APIRouter(prefix="/trees", tags=["trees"])
 @router.get('/next_number')
 def get_next_tree_number(db: Session = Depends(get_db)):
     """Return the next global tree number like TREE-000001 (no daily reset)."""
-    rows = db.query(models.Tree.tree_no).all()
-    max_seq = 0
-    for (s,) in rows:
-        if not s:
-            continue
-        m = re.search(r'(\d+)$', s.strip())
-        if m:
-            n = int(m.group(1))
-            if n > max_seq:
-                max_seq = n
+    if db.get_bind().dialect.name == "postgresql":
+        # MAX of the trailing digits, computed in the database: one row back
+        # instead of every tree_no
+        suffix = func.substring(models.Tree.tree_no, r'(\d+)\s*$')
+        max_seq = db.execute(select(func.max(cast(suffix, BigInteger)))).scalar() or 0
+    else:
+        max_seq = 0
+        for (s,) in db.query(models.Tree.tree_no).all():
+            m = re.search(r'(\d+)$', (s or '').strip())
+            if m:
+                max_seq = max(max_seq, int(m.group(1)))
     next_seq = max_seq + 1
     return {'tree_no': f'TREE-{next_seq:06d}'}
 
@@ -61,23 +63,32 @@ def create_tree(payload: schemas.TreeCreate, db: Session = Depends(get_db)):
     Computes est_metal_weight using your existing formula helper.
     """
     # Validate metal
-    metal = db.get(models.Metal, payload.metal_id)
-    if not metal:
+    metal_name = cache.metal_name(db, payload.metal_id)
+    if metal_name is None:
         raise HTTPException(status_code=400, detail="invalid metal_id")
 
-    exists = db.execute(
-        select(models.Tree).where(models.Tree.tree_no == payload.tree_no)
-    ).scalar_one_or_none()
-    if exists:
+    tree_no = payload.tree_no
+    dupe = db.execute(lambda_stmt(
+        lambda: select(exists().where(models.Tree.tree_no == tree_no))
+    )).scalar()
+    if dupe:
         raise HTTPException(status_code=409, detail="A tree with this Tree No already exists")
 
-    # At this point payload.tree_weight is guaranteed by schema:
-    # - either provided explicitly, or
-    # - derived from gasket/total inside TreeCreate model_validator
-    tree_wt = float(payload.tree_weight)
+    # Accept either explicit tree_weight or both gasket+total
+    if payload.tree_weight is not None:
+        tree_wt = float(payload.tree_weight)
+    elif payload.gasket_weight is not None and payload.total_weight is not None:
+        if payload.total_weight < payload.gasket_weight:
+            raise HTTPException(status_code=422, detail="total_weight must be >= gasket_weight")
+        tree_wt = float(payload.total_weight - payload.gasket_weight)
+    else:
+        raise HTTPException(
+            status_code=422,
+            detail="Provide either tree_weight OR both gasket_weight and total_weight.",
+        )
 
     # Estimate metal using your formula
-    est = est_metal_weight(tree_wt, metal.name)
+    est = est_metal_weight(tree_wt, metal_name)
 
     tree = models.Tree(
         date=payload.date,
@@ -95,33 +106,40 @@ def create_tree(payload: schemas.TreeCreate, db: Session = Depends(get_db)):
     db.flush()  # get tree.id
 
     # --- upsert/attach bags ---
-    bag_nos = [b.strip().upper() for b in (payload.bag_nos or []) if b and b.strip()]
+    # normalized, de-duplicated (first occurrence wins)
+    bag_nos = list(dict.fromkeys(b.strip().upper() for b in (payload.bag_nos or []) if b and b.strip()))
     if bag_nos:
-        existing = db.query(models.Bag).filter(models.Bag.bag_no.in_(bag_nos)).all()
-        existing_by_no = {b.bag_no: b for b in existing}
-        to_attach = []
-        for bno in bag_nos:
-            bag = existing_by_no.get(bno)
-            if not bag:
-                bag = models.Bag(bag_no=bno)
-                db.add(bag)
-                db.flush()  # get bag.id
-            to_attach.append(bag)
-        tree.bags = list({*tree.bags, *to_attach})  # merge unique
+        # create whatever is missing, then link them all straight through the
+        # association table: two statements however many bags, no ORM collection load
+        db.execute(
+            pg_insert(models.Bag)
+            .values([{"bag_no": bno} for bno in bag_nos])
+            .on_conflict_do_nothing(index_elements=[models.Bag.bag_no])
+        )
+        db.execute(
+            pg_insert(models.tree_bags)
+            .from_select(
+                ["tree_id", "bag_id"],
+                select(literal(tree.id), models.Bag.id).where(models.Bag.bag_no.in_(bag_nos)),
+            )
+            .on_conflict_do_nothing()
+        )
 
     db.commit()
+    cache.transit_summary.clear()
     db.refresh(tree)
 
-    return schemas.TreeOut(
-        id=tree.id,
-        date=tree.date,
-        tree_no=tree.tree_no,
-        metal_id=tree.metal_id,
-        metal_name=metal.name,
-        gasket_weight=tree.gasket_weight,
-        total_weight=tree.total_weight,
-        tree_weight=tree.tree_weight,
-        est_metal_weight=tree.est_metal_weight,
-        status=tree.status.value,
-        bag_nos=[b.bag_no for b in tree.bags],  # NEW
-    )
+    # plain dict: response_model=TreeOut validates it exactly once on the way out
+    return {
+        "id": tree.id,
+        "date": tree.date,
+        "tree_no": tree.tree_no,
+        "metal_id": tree.metal_id,
+        "metal_name": metal_name,
+        "gasket_weight": tree.gasket_weight,
+        "total_weight": tree.total_weight,
+        "tree_weight": tree.tree_weight,
+        "est_metal_weight": tree.est_metal_weight,
+        "status": tree.status.value,
+        "bag_nos": bag_nos,  # the new tree has exactly these bags
+    }
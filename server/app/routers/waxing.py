@@ -1,17 +1,19 @@
 # server/app/routers/waxing.py
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import cast, exists, insert, lambda_stmt, literal, select, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import date as dtdate
 
-from ..db import get_db
-from .. import models, schemas
+from ..db import get_db, get_async_db
+from .. import cache, models, schemas
 from ..formulas import est_metal_weight  # your helper
 
 router = APIRouter(prefix="/waxing", tags=["waxing"])
 
 @router.post("/post_to_prep")
-def post_flask_from_tree(payload: schemas.PostFlaskFromTree, db: Session = Depends(get_db)):
+async def post_flask_from_tree(payload: schemas.PostFlaskFromTree, db: AsyncSession = Depends(get_async_db)):
     """
     From a Tree in transit, create a Flask and WaxingEntry, and move flask to METAL_PREP.
 
@@ -23,47 +25,140 @@ def post_flask_from_tree(payload: schemas.PostFlaskFromTree, db: Session = Depen
       - flask_id, tree_id, metal_weight (final), tree_weight, status
     """
     # 1) Load and validate the tree
-    tree = db.get(models.Tree, payload.tree_id)
+    tree = await db.get(models.Tree, payload.tree_id)
     if not tree or tree.status != models.TreeStatus.transit:
         raise HTTPException(status_code=400, detail="tree not in transit")
 
     # 2) Metal for formula
-    metal = db.get(models.Metal, tree.metal_id)
-    if not metal:
+    metal_name = await cache.metal_name_async(db, tree.metal_id)
+    if metal_name is None:
         raise HTTPException(status_code=400, detail="invalid metal on tree")
 
 
-    # before inserting the new flask …
-    dupe = db.execute(
-        select(models.Flask.id)
-        .where(
-            models.Flask.date == payload.date,
-            models.Flask.flask_no == payload.flask_no,
-        )
-    ).first()
+    # 3) Compute final metal weight from weights entered here
+    tree_weight = float(payload.total_weight) - float(payload.gasket_weight)
+    if tree_weight < 0:
+        raise HTTPException(status_code=400, detail="total_weight must be >= gasket_weight")
 
-    if dupe:
-        raise HTTPException(
-            status_code=409,
-            detail=f'Flask #{payload.flask_no} is already used on {payload.date:%m-%d-%Y}',
+    final_metal_weight = est_metal_weight(tree_weight, metal_name)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # flask + waxing entry + tree status in one statement
+        flask_id = await _post_to_prep_pg(db, payload, tree_weight, final_metal_weight)
+    else:
+        flask_id = await _post_to_prep_orm(db, payload, tree, tree_weight, final_metal_weight)
+
+    await db.commit()
+    cache.transit_summary.clear()
+
+    return {
+        "flask_id": flask_id,
+        "tree_id": payload.tree_id,
+        "metal_weight": float(final_metal_weight),
+        "tree_weight": float(tree_weight),
+        "status": models.Stage.metal_prep.value,
+    }
+
+
+def _dupe_flask(payload: schemas.PostFlaskFromTree) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail=f'Flask #{payload.flask_no} is already used on {payload.date:%m-%d-%Y}',
+    )
+
+
+async def _post_to_prep_pg(
+    db: AsyncSession, payload: schemas.PostFlaskFromTree, tree_weight: float, metal_weight: float
+) -> int:
+    """
+    WITH src AS (SELECT id, metal_id FROM trees WHERE id = :tree_id AND status = 'transit' FOR UPDATE),
+         ins_flask AS (INSERT INTO flasks ... SELECT FROM src ON CONFLICT DO NOTHING RETURNING id, tree_id),
+         ins_wax AS (INSERT INTO waxing_entries ... SELECT FROM ins_flask),
+         upd_tree AS (UPDATE trees SET status = 'consumed' WHERE id IN (SELECT tree_id FROM ins_flask))
+    SELECT src.id, ins_flask.id
+
+    The (date, flask_no) unique constraint replaces the duplicate pre-check. The
+    tree is only marked consumed when the flask insert went through, so the 409
+    path writes nothing even if it were committed; the row lock makes a
+    concurrent post of the same tree wait, then find it no longer in transit.
+    Values are CAST to the column types because INSERT ... SELECT can't infer
+    parameter types; enums are bound as their label string (.value == name).
+    """
+    t, f, w = models.Tree, models.Flask, models.WaxingEntry
+    now = models.utcnow()
+    src = (
+        select(t.id, t.metal_id)
+        .where(t.id == payload.tree_id, t.status == models.TreeStatus.transit)
+        .with_for_update()
+        .cte("src")
+    )
+    ins_flask = (
+        pg_insert(f)
+        .from_select(
+            ["date", "flask_no", "metal_id", "status", "tree_id", "created_at", "updated_at"],
+            select(
+                cast(literal(payload.date), f.date.type),
+                cast(literal(payload.flask_no.strip()), f.flask_no.type),
+                src.c.metal_id,
+                cast(literal(models.Stage.metal_prep.value), f.status.type),
+                src.c.id,
+                cast(literal(now), f.created_at.type),
+                cast(literal(now), f.updated_at.type),
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=[f.date, f.flask_no])
+        .returning(f.id, f.tree_id)
+        .cte("ins_flask")
+    )
+    ins_wax = (
+        insert(w)
+        .from_select(
+            ["flask_id", "gasket_weight", "tree_weight", "metal_weight", "posted_at", "posted_by"],
+            select(
+                ins_flask.c.id,
+                cast(literal(payload.gasket_weight), w.gasket_weight.type),
+                cast(literal(tree_weight), w.tree_weight.type),
+                cast(literal(metal_weight), w.metal_weight.type),
+                cast(literal(now), w.posted_at.type),
+                cast(literal(payload.posted_by), w.posted_by.type),
+            ),
         )
+        .cte("ins_wax")
+    )
+    upd_tree = (
+        update(t)
+        .where(t.id.in_(select(ins_flask.c.tree_id)))
+        .values(status=models.TreeStatus.consumed)
+        .cte("upd_tree")
+    )
+    row = (await db.execute(
+        select(src.c.id, ins_flask.c.id)
+        .select_from(src.outerjoin(ins_flask, true()))
+        .add_cte(ins_wax, upd_tree)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=400, detail="tree not in transit")
+    if row[1] is None:
+        raise _dupe_flask(payload)
+    return row[1]
+
+
+async def _post_to_prep_orm(
+    db: AsyncSession, payload: schemas.PostFlaskFromTree, tree: models.Tree,
+    tree_weight: float, metal_weight: float,
+) -> int:
+    """Same writes as _post_to_prep_pg, one ORM statement at a time (non-Postgres)."""
+    # lambda_stmt: built and cache-keyed once; date/flask_no bind per call
+    date, flask_no = payload.date, payload.flask_no
+    dupe = (await db.execute(lambda_stmt(
+        lambda: select(exists().where(
+            models.Flask.date == date,
+            models.Flask.flask_no == flask_no,
+        ))
+    ))).scalar()
 
-    # # 3) Prevent creating a new flask if this flask_no is already in rotation
-    # active_dup = db.execute(
-    #     select(models.Flask.id, models.Flask.date, models.Flask.status)
-    #     .where(
-    #         models.Flask.flask_no == payload.flask_no.strip(),
-    #         models.Flask.status != models.Stage.done,
-    #     )
-    # ).first()
-
-    # if active_dup:
-    #     rid, rdate, rstatus = active_dup
-    #     raise HTTPException(
-    #         status_code=409,
-    #         detail=f"Flask No '{payload.flask_no}' is already active (status={rstatus}, date={rdate}). "
-    #             "Finish the other flask before reusing this number.",
-    #     )
+    if dupe:
+        raise _dupe_flask(payload)
 
     # 4) Create the flask in METAL_PREP
     flask = models.Flask(
@@ -74,47 +169,30 @@ def post_flask_from_tree(payload: schemas.PostFlaskFromTree, db: Session = Depen
         tree_id=tree.id,
     )
     db.add(flask)
-    db.flush()  # get flask.id
-
-    # 5) Compute final metal weight from weights entered here
-    tree_weight = float(payload.total_weight) - float(payload.gasket_weight)
-    if tree_weight < 0:
-        raise HTTPException(status_code=400, detail="total_weight must be >= gasket_weight")
-
-    final_metal_weight = est_metal_weight(tree_weight, metal.name)
+    await db.flush()  # get flask.id
 
-    # 6) Write the WaxingEntry (source of truth for required metal)
+    # 5) Write the WaxingEntry (source of truth for required metal)
     db.add(models.WaxingEntry(
         flask_id=flask.id,
         gasket_weight=payload.gasket_weight,
         tree_weight=tree_weight,
-        metal_weight=final_metal_weight,
+        metal_weight=metal_weight,
         posted_by=payload.posted_by,
     ))
 
-    # 7) Mark the tree consumed
+    # 6) Mark the tree consumed
     tree.status = models.TreeStatus.consumed
-
-    db.commit()
-
-    return {
-        "flask_id": flask.id,
-        "tree_id": tree.id,
-        "metal_weight": float(final_metal_weight),
-        "tree_weight": float(tree_weight),
-        "status": models.Stage.metal_prep.value,
-    }
+    return flask.id
 
 @router.get("/check_flask_unique")
 def check_flask_unique(date: dtdate, flask_no: str, db: Session = Depends(get_db)):
     # same per-date uniqueness check
-    dupe = db.execute(
-        select(models.Flask.id)
-        .where(
+    dupe = db.execute(lambda_stmt(
+        lambda: select(exists().where(
             models.Flask.date == date,
             models.Flask.flask_no == flask_no,
-        )
-    ).first()
+        ))
+    )).scalar()
     if dupe:
         # identical message to post_to_prep
         raise HTTPException(
@@ -1,7 +1,13 @@
-from pydantic import BaseModel, condecimal, field_validator, Field, ValidationError, model_validator, confloat
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import date
 from decimal import Decimal
-from typing import List
+from typing import Annotated, List
+
+
+# shared constrained types: one definition each instead of a condecimal(...) per field
+Weight = Annotated[Decimal, Field(max_digits=12, decimal_places=3, ge=0)]
+Decimal3 = Annotated[Decimal, Field(max_digits=12, decimal_places=3)]
+NonNegFloat = Annotated[float, Field(ge=0)]
 
 
 # ---------- Trees ----------
@@ -11,30 +17,17 @@ class TreeCreate(BaseModel):
     metal_id: int
 
     # NEW: capture at tree stage (optional but preferred)
-    gasket_weight: condecimal(max_digits=12, decimal_places=3, ge=0) | None = None  # type: ignore
-    total_weight:  condecimal(max_digits=12, decimal_places=3, ge=0) | None = None  # type: ignore
+    gasket_weight: Weight | None = None
+    total_weight:  Weight | None = None
 
-    # Back-compat: allow explicit tree_weight if legacy UI still sends it
-    tree_weight: condecimal(max_digits=12, decimal_places=3, ge=0) | None = None  # type: ignore
+    # Back-compat: allow explicit tree_weight if legacy UI still sends it;
+    # otherwise create_tree derives it from gasket + total
+    tree_weight: Weight | None = None
 
     posted_by: str
 
     bag_nos: List[str] = []
 
-    @model_validator(mode="after")
-    def ensure_weights(self):
-        # Accept either explicit tree_weight or both gasket+total
-        if self.tree_weight is not None:
-            return self
-        if self.gasket_weight is not None and self.total_weight is not None:
-            if self.total_weight < self.gasket_weight:
-                raise ValueError("total_weight must be >= gasket_weight")
-            # Derive tree_weight for server-side use
-            object.__setattr__(self, "tree_weight", (self.total_weight - self.gasket_weight))  # pydantic v2 pattern
-            return self
-        raise ValidationError(
-            "Provide either tree_weight OR both gasket_weight and total_weight."
-        )
 
 class TreeOut(BaseModel):
     id: int
@@ -43,42 +36,34 @@ class TreeOut(BaseModel):
     metal_id: int
     metal_name: str
     # NEW: expose captured values (may be null if created via legacy flow)
-    gasket_weight: condecimal(max_digits=12, decimal_places=3) | None = None  # type: ignore
-    total_weight:  condecimal(max_digits=12, decimal_places=3) | None = None  # type: ignore
+    gasket_weight: Decimal3 | None = None
+    total_weight:  Decimal3 | None = None
 
-    tree_weight: condecimal(max_digits=12, decimal_places=3)  # type: ignore
-    est_metal_weight: condecimal(max_digits=12, decimal_places=3)  # type: ignore
+    tree_weight: Decimal3
+    est_metal_weight: Decimal3
     status: str
 
     bag_nos: List[str] = []
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # ---------- Waxing ----------
 class PostFlaskFromTree(BaseModel):
     tree_id: int
     flask_no: str
     date: date
-    gasket_weight: condecimal(max_digits=12, decimal_places=3, ge=0)  # type: ignore
-    total_weight: condecimal(max_digits=12, decimal_places=3, ge=0)   # type: ignore
+    gasket_weight: Weight
+    total_weight: Weight
     posted_by: str
 
 class WaxingCreate(BaseModel):
     date: date
     flask_no: str
     metal_id: int
-    gasket_weight: float
-    tree_weight: float
+    gasket_weight: NonNegFloat
+    tree_weight: NonNegFloat
     posted_by: str
 
-    @field_validator("gasket_weight", "tree_weight")
-    @classmethod
-    def nonneg(cls, v):
-        if v < 0:
-            raise ValueError("weight must be >= 0")
-        return v
-    
 # ---------- Metal Prep ----------
 class PrepCreate(BaseModel):
     flask_id: int
@@ -97,15 +82,14 @@ class PrepOut(BaseModel):
     alloy_planned: float
     pure_planned: float
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # ---------- Supply ----------
 class SupplyCreate(BaseModel):
     flask_id: int
-    scrap_supplied: confloat(ge=0) = Field(..., description="Scrap used toward required metal")  # type: ignore
-    fine_24k_supplied: confloat(ge=0) = 0.0  # type: ignore
-    alloy_supplied: confloat(ge=0) = 0.0     # type: ignore
+    scrap_supplied: NonNegFloat = Field(..., description="Scrap used toward required metal")
+    fine_24k_supplied: NonNegFloat = 0.0
+    alloy_supplied: NonNegFloat = 0.0
     posted_by: str
 
 # ---------- Cutting ----------
@@ -119,10 +103,10 @@ class CuttingCreate(BaseModel):
 # schemas.py
 class ReconciliationCreate(BaseModel):
     flask_id: int
-    supplied_weight: condecimal(max_digits=12, decimal_places=3)
-    before_cut_weight: condecimal(max_digits=12, decimal_places=3)
-    after_cast_weight: condecimal(max_digits=12, decimal_places=3)
-    after_scrap_weight: condecimal(max_digits=12, decimal_places=3)
+    supplied_weight: Decimal3
+    before_cut_weight: Decimal3
+    after_cast_weight: Decimal3
+    after_scrap_weight: Decimal3
     notes: str | None = None
     posted_by: str
 
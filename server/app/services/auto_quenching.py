@@ -1,58 +1,110 @@
 # app/services/auto_quenching.py
 import asyncio
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timedelta
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
 
-from ..db import SessionLocal
+from ..db import AsyncSessionLocal
 from .. import models
 from ..websockets import manager   # you already broadcast on manual post
 
 CUTOVER_DELAY = timedelta(minutes=1)       # "1 minute after DONE"
-POLL_INTERVAL = 30                         # how often to look for ready flasks
+POLL_INTERVAL = 60                         # retry delay after a failed sweep
+IDLE_RECHECK = timedelta(seconds=60)       # fallback poll: catches quenching rows written without schedule_sweep
+                                           # (another worker/process, scripts) within a minute
+
+_wakeup = asyncio.Event()                  # set by schedule_sweep's timers
+_next_due: datetime | None = None          # earliest time a sweep can advance anything (None = unknown)
+
+
+def _note_due(at: datetime):
+    """Pull the next poll forward to `at` (naive UTC) if that is sooner."""
+    global _next_due
+    if _next_due is not None and at < _next_due:
+        _next_due = at
+
+
+def _sweep_due() -> bool:
+    return _next_due is None or models.utcnow() >= _next_due
+
 
 async def _advance_ready_flasks_once() -> int:
     """Promote any flasks that have been ready >= CUTOVER_DELAY."""
-    now_utc = datetime.now(timezone.utc)
-    cutoff = now_utc - CUTOVER_DELAY
-    advanced = 0
-
-    with SessionLocal() as db:                         # new session per sweep
-        # Find flasks in quenching whose ready_at is past cutoff
-        q = (
-            select(models.Flask.id)
-            .join(models.Quenching, models.Quenching.flask_id == models.Flask.id)
-            .where(models.Flask.status == models.Stage.quenching)
-            .where(models.Quenching.ready_at <= cutoff)
-        )
-        flask_ids = list(db.execute(q).scalars())
-
-        for fid in flask_ids:
-            # Double-check & advance atomically in this transaction
-            f: models.Flask | None = db.get(models.Flask, fid)
-            if not f or f.status != models.Stage.quenching:
-                continue
-            f.status = models.Stage.cutting
-            f.updated_at = now_utc
-            db.commit()
-            advanced += 1
-            # let any connected UIs know
-            try:
-                await manager.broadcast({"event": "quenching_auto_posted", "flask_id": f.id})
-            except Exception:
-                pass
-    return advanced
+    now = models.utcnow()  # quenching.ready_at is naive UTC
+    cutoff = now - CUTOVER_DELAY
+    f, qn = models.Flask, models.Quenching
+
+    async with AsyncSessionLocal() as db:              # pooled connection per sweep; never blocks the loop
+        # one UPDATE ... RETURNING for every due flask; the status check in the
+        # WHERE keeps it safe against a manual post racing the sweep
+        flask_ids = (await db.execute(
+            update(f)
+            .where(
+                f.status == models.Stage.quenching,
+                f.id.in_(select(qn.flask_id).where(qn.ready_at <= cutoff)),
+            )
+            .values(status=models.Stage.cutting, updated_at=now)
+            .returning(f.id)
+        )).scalars().all()
+        # earliest flask still quenching: the loop sleeps until then
+        next_ready = (await db.execute(
+            select(func.min(qn.ready_at))
+            .join(f, f.id == qn.flask_id)
+            .where(f.status == models.Stage.quenching)
+        )).scalar()
+        await db.commit()
+
+    global _next_due
+    recheck = now + IDLE_RECHECK
+    _next_due = min(next_ready + CUTOVER_DELAY, recheck) if next_ready else recheck
+
+    # session is closed by now; let any connected UIs know without waiting on
+    # them, in one frame per client however many flasks moved
+    if flask_ids:
+        manager.broadcast_nowait({"event": "quenching_auto_batch", "flask_ids": list(flask_ids)})
+        # DEPRECATED: per-flask events for clients that predate the batch event;
+        # kept until they have moved to quenching_auto_batch (see README)
+        for flask_id in flask_ids:
+            manager.broadcast_nowait({"event": "quenching_auto_posted", "flask_id": flask_id})
+    return len(flask_ids)
+
+
+def _wake():
+    """Timer callback: a flask is due now; cut the loop's wait short."""
+    _note_due(models.utcnow())
+    _wakeup.set()
+
+
+def schedule_sweep(quench_seconds: float):
+    """Sweep exactly when a just-cast flask becomes due, instead of waiting for the next poll."""
+    delay = quench_seconds + CUTOVER_DELAY.total_seconds()
+    asyncio.get_running_loop().call_later(delay, _wake)
+
+
+def _seconds_until_due() -> float:
+    if _next_due is None:
+        return POLL_INTERVAL
+    return max(0.0, (_next_due - models.utcnow()).total_seconds())
 
 
 async def auto_quenching_loop():
-    """Background loop started on app startup."""
+    """
+    Background loop started on app startup. Sleeps until the earliest quenching
+    flask is due (or IDLE_RECHECK), and is woken early by schedule_sweep's timers.
+    """
     # small delay so startup finishes cleanly
     await asyncio.sleep(2)
     while True:
+        _wakeup.clear()  # before sweeping, so a wake during the sweep isn't lost
         try:
-            await _advance_ready_flasks_once()
+            if _sweep_due():
+                await _advance_ready_flasks_once()
+            timeout = _seconds_until_due()
         except Exception:
             # keep the loop alive even if something goes wrong
             import logging; logging.exception('auto_quenching_loop iteration failed')
-        await asyncio.sleep(POLL_INTERVAL)
+            timeout = POLL_INTERVAL
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -1,18 +1,36 @@
-from typing import Set
+import asyncio
+
+import orjson
 from fastapi import WebSocket
 
+SEND_TIMEOUT = 1.0  # seconds per client before it is treated as dead
+
 class WSManager:
-    def __init__(self): 
-        self.active: Set[WebSocket] = set()
+    def __init__(self):
+        self.active: dict[int, WebSocket] = {}  # id(ws) -> ws
+        self._snapshot: tuple[WebSocket, ...] = ()  # rebuilt on connect/disconnect, read by broadcast
+        self._pending: set[asyncio.Task] = set()  # keep fire-and-forget tasks alive until done
     async def connect(self, ws: WebSocket):
-        await ws.accept(); self.active.add(ws)
+        await ws.accept(); self.active[id(ws)] = ws
+        self._snapshot = tuple(self.active.values())
     def disconnect(self, ws: WebSocket):
-        self.active.discard(ws)
+        if self.active.pop(id(ws), None) is not None:
+            self._snapshot = tuple(self.active.values())
     async def broadcast(self, message: dict):
-        for ws in list(self.active):
-            try:
-                await ws.send_json(message)
-            except Exception:
+        # send to every client concurrently; a slow or dead socket gets dropped
+        clients = self._snapshot
+        text = orjson.dumps(message).decode()  # encode once, not once per client
+        results = await asyncio.gather(
+            *(asyncio.wait_for(ws.send_text(text), SEND_TIMEOUT) for ws in clients),
+            return_exceptions=True,
+        )
+        for ws, result in zip(clients, results):
+            if isinstance(result, BaseException):
                 self.disconnect(ws)
+    def broadcast_nowait(self, message: dict):
+        """Schedule a broadcast so the HTTP response doesn't wait on websocket clients."""
+        task = asyncio.create_task(self.broadcast(message))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
 
 manager = WSManager()
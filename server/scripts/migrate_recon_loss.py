@@ -0,0 +1,62 @@
+# server/scripts/migrate_recon_loss.py
+"""
+One-off upgrade for databases created before the reconciliation loss columns
+became database-generated. Replaces the plain loss_part_i / loss_part_ii /
+loss_total columns with GENERATED ALWAYS AS (...) STORED ones (the expressions
+come from app.models, so they can't drift). Safe to re-run: does nothing once
+the columns are generated. Postgres only.
+
+    docker compose exec api python scripts/migrate_recon_loss.py
+"""
+from __future__ import annotations
+import os
+import sys
+from pathlib import Path
+
+# --- ensure we can import "app.*" (app.db loads .env itself) ---
+SERVER_DIR = Path(__file__).resolve().parents[1]
+if str(SERVER_DIR) not in sys.path:
+    sys.path.insert(0, str(SERVER_DIR))
+
+from sqlalchemy import text
+from app.db import engine
+from app.models import Reconciliation
+
+LOSS_COLUMNS = ("loss_part_i", "loss_part_ii", "loss_total")
+
+
+def migration_sql(dialect) -> str:
+    table = Reconciliation.__table__
+    drops = [f"DROP COLUMN {name}" for name in LOSS_COLUMNS]
+    adds = [
+        f"ADD COLUMN {name} {table.c[name].type.compile(dialect=dialect)} "
+        f"GENERATED ALWAYS AS ({table.c[name].computed.sqltext}) STORED"
+        for name in LOSS_COLUMNS
+    ]
+    return f"ALTER TABLE {table.name}\n  " + ",\n  ".join(drops + adds)
+
+
+def main():
+    print('DATABASE_URL =', os.getenv('DATABASE_URL'))
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("Postgres only; other databases get the generated columns from create_all.")
+
+    with engine.begin() as conn:
+        generated = conn.execute(text(
+            "SELECT is_generated FROM information_schema.columns "
+            "WHERE table_name = 'reconciliation' AND column_name = 'loss_total'"
+        )).scalar()
+        if generated is None:
+            print("No reconciliation table yet; create_all will build it with generated columns.")
+            return
+        if generated == "ALWAYS":
+            print("Loss columns are already generated; nothing to do.")
+            return
+        sql = migration_sql(conn.dialect)
+        print(sql)
+        conn.execute(text(sql))
+    print("Reconciliation loss columns are now generated.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 # server/scripts/reset_db.py
-import sys, os
+import argparse, sys, os
 from pathlib import Path
 
 # Ensure we can import "app" package
@@ -26,15 +26,34 @@ os.environ.setdefault("DATABASE_URL", "postgresql://myappuser:Q12QnalVgyvo2zy7cF
 
 print("DATABASE_URL seen by reset_db.py =>", os.getenv("DATABASE_URL"))
 
+from sqlalchemy import text
+
 from app.db import engine
 from app.models import Base
 
 def main():
-    print("Dropping all tables…")
-    Base.metadata.drop_all(bind=engine)
-    print("Recreating tables from current models…")
-    Base.metadata.create_all(bind=engine)
-    print("DB reset complete.")
+    parser = argparse.ArgumentParser(description="Rebuild the database from the models (or just empty it).")
+    parser.add_argument("--truncate", action="store_true",
+                        help="keep the existing schema and only empty every table (faster); "
+                             "only safe when the models have not changed since the tables were created")
+    args = parser.parse_args()
+
+    if not args.truncate:
+        # no migrations yet: rebuilding is the only way to pick up model changes
+        print("Dropping all tables…")
+        Base.metadata.drop_all(bind=engine)
+        print("Recreating tables from current models…")
+        Base.metadata.create_all(bind=engine)
+        print("DB reset complete.")
+        return
+
+    Base.metadata.create_all(bind=engine)  # no-op when the tables exist
+    with engine.begin() as conn:           # one transaction, one statement
+        quote = conn.dialect.identifier_preparer.format_table
+        tables = ", ".join(quote(t) for t in Base.metadata.sorted_tables)
+        print("Truncating all tables…")
+        conn.execute(text(f"TRUNCATE TABLE {tables} RESTART IDENTITY CASCADE"))
+    print("DB reset complete (schema kept).")
 
 if __name__ == "__main__":
     main()
@@ -24,7 +24,7 @@ else:
     print('WARNING: .env not found at repo root; relying on process env.')
 
 # --- normal app imports ---
-from sqlalchemy import text
+from sqlalchemy import insert, text
 from app.db import SessionLocal, engine, Base
 from app.models import Metal, ScrapReserve
 
@@ -45,25 +45,24 @@ def main():
         print('Resetting metals & scrap_reserves…')
         s.execute(text('TRUNCATE TABLE scrap_reserves RESTART IDENTITY CASCADE;'))
         s.execute(text('TRUNCATE TABLE metals RESTART IDENTITY CASCADE;'))
-        s.commit()
 
-        # insert metals
-        metal_objs = []
-        for name in NEW_METALS:
-            m = Metal(name=name)
-            s.add(m)
-            metal_objs.append(m)
-        s.commit()
+        # insert metals: one batched INSERT ... RETURNING, rows back in list order
+        metal_rows = s.execute(
+            insert(Metal).returning(Metal.id, Metal.name, sort_by_parameter_order=True),
+            [{'name': name} for name in NEW_METALS],
+        ).all()
 
         # seed reserves with 0
-        for m in metal_objs:
-            s.add(ScrapReserve(metal_id=m.id, qty_on_hand=0))
-        s.commit()
+        s.execute(
+            insert(ScrapReserve),
+            [{'metal_id': metal_id, 'qty_on_hand': 0} for metal_id, _ in metal_rows],
+        )
+        s.commit()  # reset + seed in one transaction
 
         print('Done: metals + reserves seeded.')
         print('Metals:')
-        for m in s.query(Metal).order_by(Metal.id).all():
-            print(f'  {m.id}: {m.name}')
+        for metal_id, name in metal_rows:  # already in hand from RETURNING
+            print(f'  {metal_id}: {name}')
 
     finally:
         s.close()
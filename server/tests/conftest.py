@@ -0,0 +1,14 @@
+# server/tests/conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+if str(SERVER_DIR) not in sys.path:
+    sys.path.insert(0, str(SERVER_DIR))
+
+# app.db builds its engines at import time: always point the app at a throwaway
+# SQLite file so a DATABASE_URL exported in the shell (or .env) is never touched.
+# Postgres-only tests connect through TEST_DATABASE_URL themselves.
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.gettempdir()) / 'jewelry_api_tests.db'}"
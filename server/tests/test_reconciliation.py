@@ -0,0 +1,81 @@
+# server/tests/test_reconciliation.py
+"""
+GET /reconciliation/{flask_id} loads the flask, its staged values, metal name
+and tree number in one joined SELECT with raiseload("*"): a relationship touched
+later would raise instead of quietly issuing a lazy load. Count the statements
+that actually reach the database.
+"""
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import models
+from app.db import Base, SessionLocal, engine
+from app.main import app
+
+DAY = date(2025, 9, 17)
+
+
+@pytest.fixture(scope="module")
+def flasks():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as s:
+        metal = models.Metal(name="14Y")
+        s.add(metal)
+        s.flush()
+        tree = models.Tree(date=DAY, tree_no="TREE-000001", metal_id=metal.id, tree_weight=1,
+                           est_metal_weight=13.25, posted_by="test")
+        s.add(tree)
+        s.flush()
+        staged = models.Flask(date=DAY, flask_no="F-1", metal_id=metal.id, tree_id=tree.id,
+                              status=models.Stage.reconciliation)
+        bare = models.Flask(date=DAY, flask_no="F-2", metal_id=metal.id, status=models.Stage.reconciliation)
+        s.add_all([staged, bare])
+        s.flush()
+        s.add(models.Reconciliation(flask_id=staged.id, supplied_weight=10, before_cut_weight=10,
+                                    after_cast_weight=9, after_scrap_weight=0.9, posted_by="test"))
+        s.commit()
+        yield staged.id, bare.id
+    Base.metadata.drop_all(bind=engine)
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_get_recon_is_one_select(flasks):
+    staged_id, bare_id = flasks
+    client = TestClient(app)
+
+    with count_statements() as statements:
+        r = client.get(f"/reconciliation/{staged_id}")
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["metal_name"], body["tree_no"]) == ("14Y", "TREE-000001")
+    assert body["before_cut_weight"] == 10.0
+    assert len(statements) == 1
+
+    # no staged row / no tree: the outer joins still answer in one statement
+    with count_statements() as statements:
+        r = client.get(f"/reconciliation/{bare_id}")
+    assert r.status_code == 200
+    assert (r.json()["tree_no"], r.json()["supplied_weight"]) == (None, 0.0)
+    assert len(statements) == 1
+
+    with count_statements() as statements:
+        assert client.get("/reconciliation/999999").status_code == 404
+    assert len(statements) == 1